@@ -0,0 +1,61 @@
+"""Benchmark: per-card WebDriver calls vs one in-page script on the upload page
+
+Loads fixtures/upload_page.html (40 cards, same DOM path as the live
+upload page) in headless Chrome and times the old per-element loop against
+upload_page.extract_cards.
+
+    python bench_card_extract.py --rounds 20
+"""
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.service import Service
+from browser import get_driver_path
+from upload_page import CARD_IMG_SELECTOR, extract_cards
+import argparse
+import os
+import time
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "upload_page.html")
+
+
+def legacy_extract(driver):
+    """The per-element loop test4.py used to run: three round trips per card"""
+    videos = []
+    for element in driver.find_elements(By.CSS_SELECTOR, CARD_IMG_SELECTOR):
+        alt_name = element.get_attribute("alt")
+        parent_a = element.find_element(By.XPATH, "./ancestor::a")
+        videos.append({"alt": alt_name, "url": parent_a.get_attribute("href")})
+    return videos
+
+
+def timed(name, extract, driver, rounds):
+    """Run extract rounds times and print the mean time per page"""
+    result = extract(driver)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extract(driver)
+    per_page = (time.perf_counter() - start) / rounds * 1000
+    print(f"{name:<8} {per_page:8.1f} ms/page  {per_page / max(1, len(result)):6.2f} ms/card  cards={len(result)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    driver = webdriver.Chrome(service=Service(get_driver_path()), options=options)
+    try:
+        driver.get("file://" + FIXTURE)
+        legacy = timed("legacy", legacy_extract, driver, args.rounds)
+        script = timed("script", extract_cards, driver, args.rounds)
+        same = [(v["alt"], v["url"]) for v in legacy] == [(v["alt"], v["url"]) for v in script]
+        print(f"same alt/url as legacy: {same}")
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Benchmark: end-to-end crawl throughput against the local mock site
+
+Starts mock_bilibili.py in a subprocess, then lists one UID's uploads with
+BilibiliCrawler and captures their subtitles with BilibiliSubtitleCrawler
+in lean headless Chrome. Reports videos/minute, p50/p95 per-video latency
+and memory for each stage. Per-video latency is the time since the same
+worker finished its previous video (for listing: since the previous video
+was listed), so batches of cards show up as a low p50 and a high p95.
+
+    python bench_crawl.py --videos 80 --workers 2 --latency 0.05 --error-rate 0.02
+    python bench_crawl.py --listing browser --resolver http
+"""
+from browser import create_driver
+from rate_limit import AdaptiveRateLimiter
+from test4 import BilibiliCrawler
+from test6 import BilibiliSubtitleCrawler
+from metrics import metrics, log_summary
+from collections import Counter
+import argparse
+import math
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_bilibili.py")
+
+
+def percentile(values, q):
+    """Return the q-th percentile (0-100) of values by nearest rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class LatencyTimer:
+    """Collect per-video latencies as the time since the calling thread's previous video"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.last = {}
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def tick(self, *args):
+        now = time.monotonic()
+        with self.lock:
+            thread = threading.get_ident()
+            self.latencies.append(now - self.last.get(thread, self.start))
+            self.last[thread] = now
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+
+def report(name, timer, extra=""):
+    """Print throughput, latency percentiles and the Python heap peak of one stage"""
+    count = len(timer.latencies)
+    elapsed = timer.elapsed()
+    per_minute = count / elapsed * 60 if elapsed else 0.0
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"{name:<10} videos={count:<5d} {elapsed:7.1f}s {per_minute:8.1f} videos/min  "
+          f"p50={percentile(timer.latencies, 50):6.2f}s  p95={percentile(timer.latencies, 95):6.2f}s  "
+          f"heap peak={peak / 2 ** 20:6.1f} MiB  {extra}")
+    tracemalloc.reset_peak()
+
+
+def start_mock(args):
+    """Start the mock server on a free port and wait until it answers, return (process, base URL)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, MOCK_SERVER, "--port", str(port), "--videos", str(args.videos),
+                                "--subtitle-rate", str(args.subtitle_rate), "--latency", str(args.latency),
+                                "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)],
+                               stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(base_url + "/mock/stats", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("mock server did not start")
+            time.sleep(0.1)
+
+
+def bench_listing(args, driver, base_url, workdir):
+    """List all uploads of the benchmark UID, return the listed videos"""
+    crawler = BilibiliCrawler(listing=args.listing, api_base=base_url, space_base=base_url, video_base=base_url,
+                              journal_path=os.path.join(workdir, "videos.journal.jsonl"), data_dir=workdir,
+                              lean=True, limiter=AdaptiveRateLimiter(rate=args.rate, max_rate=args.rate))
+    crawler.log = lambda message: None
+    crawler.driver = driver
+    timer = LatencyTimer()
+    crawler.on_video = timer.tick
+    videos = crawler.list_videos(args.uid)
+    report("listing", timer, f"({args.listing})")
+    return videos
+
+
+def bench_subtitles(args, driver, base_url, workdir, videos):
+    """Capture the subtitles of videos with the subtitle workers"""
+    crawler = BilibiliSubtitleCrawler(workers=args.workers, resolver=args.resolver, api_base=base_url,
+                                      capture_timeout=args.capture_timeout,
+                                      journal_path=os.path.join(workdir, "subtitles.journal.jsonl"),
+                                      cache_path=None, lean=True,
+                                      limiter=AdaptiveRateLimiter(rate=args.rate, max_rate=args.rate))
+    crawler.log = lambda message: None
+    crawler.driver = driver
+    crawler.prepare()
+    tasks = queue.Queue()
+    for i, video in enumerate(videos, 1):
+        tasks.put((i, video))
+    for _ in range(crawler.workers):
+        tasks.put(None)
+
+    timer = LatencyTimer()
+    statuses = Counter()
+
+    def on_result(index, video_data):
+        timer.tick()
+        statuses[video_data["subtitle_status"]] += 1
+
+    try:
+        crawler.run_workers(tasks, on_result=on_result)
+    finally:
+        crawler.close()
+    failed = len(videos) - sum(statuses.values())
+    report("subtitles", timer, f"({args.resolver}, {args.workers} workers) {dict(statuses)} failed={failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uid", default="10001")
+    parser.add_argument("--videos", type=int, default=80, help="uploads of the benchmark UID")
+    parser.add_argument("--listing", choices=["browser", "api"], default="api")
+    parser.add_argument("--resolver", choices=["browser", "http"], default="browser")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--capture-timeout", type=float, default=10)
+    parser.add_argument("--subtitle-rate", type=float, default=0.8)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock latency of JSON and subtitle responses")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=100.0, help="rate limit per host, high to measure the crawler")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="also record per-stage timings to PATH and print where the time went")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.configure(args.metrics)
+
+    process, base_url = start_mock(args)
+    workdir = tempfile.mkdtemp(prefix="bench_crawl_")
+    driver = None
+    try:
+        tracemalloc.start()
+        start = time.monotonic()
+        driver = create_driver(lean=True)
+        print(f"browser started in {time.monotonic() - start:.1f}s, mock at {base_url}")
+        tracemalloc.reset_peak()
+
+        videos = bench_listing(args, driver, base_url, workdir)
+        bench_subtitles(args, driver, base_url, workdir, videos)
+
+        stats = requests.get(base_url + "/mock/stats", timeout=5).json()
+        print(f"mock requests: {stats['requests']}  injected errors: {stats['errors']}")
+        if resource is not None:
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rss_mib = rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+            print(f"max RSS of the crawler process: {rss_mib:.1f} MiB (browser processes not included)")
+        log_summary()
+    finally:
+        if driver:
+            driver.quit()
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Micro-benchmark: per-video cost of scanning the performance log
+
+Builds a synthetic log shaped like the one a video page produces (mostly
+requestWillBeSent / dataReceived / responseReceived events for player,
+image and video segment requests, with a couple of aisubtitle responses)
+and compares the old scan in search_ai_subtitle with PerformanceLogScanner.
+
+    python bench_perf_log.py --entries 20000 --videos 20
+"""
+from perf_log import PerformanceLogScanner
+import argparse
+import json
+import random
+import time
+
+
+def make_entry(method, request_id, url):
+    """Build one performance log entry the way chromedriver reports it"""
+    params = {"requestId": request_id, "timestamp": random.random() * 1000}
+    if method == "Network.responseReceived":
+        params["response"] = {
+            "url": url,
+            "status": 200,
+            "mimeType": "application/json",
+            "headers": {"content-type": "application/json", "cache-control": "max-age=0", "x-cache": "HIT" * 20},
+        }
+    elif method == "Network.requestWillBeSent":
+        params["request"] = {"url": url, "method": "GET", "headers": {"Referer": "https://www.bilibili.com/"}}
+    else:
+        params["dataLength"] = random.randint(100, 65536)
+    message = {"message": {"method": method, "params": params}, "webview": "ABCDEF0123456789"}
+    return {"level": "INFO", "message": json.dumps(message), "timestamp": 0}
+
+
+def make_video_log(entries, video_index):
+    """Return a synthetic log for one video page with two aisubtitle responses"""
+    log = []
+    methods = ["Network.requestWillBeSent", "Network.dataReceived", "Network.responseReceived"]
+    for i in range(entries):
+        url = f"https://upos-sz-mirror.bilivideo.com/upgcxcode/{video_index}/{i}.m4s?e=ig8euxZM2rNcNbdlhoNvNC8BqJIzNbfq"
+        log.append(make_entry(methods[i % 3], str(i), url))
+    for lan in ("ai-zh", "ai-en"):
+        url = f"https://aisubtitle.hdslb.com/bfs/ai_subtitle/prod/{video_index}{lan}?auth_key=1700000000-abc-0-def"
+        log.insert(random.randrange(len(log)), make_entry("Network.responseReceived", lan, url))
+    return log
+
+
+def legacy_scan(logs, raw_logs, ai_subtitle_urls):
+    """The scan search_ai_subtitle used to do: parse everything, list dedupe, keep every entry"""
+    raw_logs.extend(logs)
+    for entry in logs:
+        try:
+            log = json.loads(entry["message"])["message"]
+            if "params" in log and "response" in log["params"] and "url" in log["params"]["response"]:
+                url = log["params"]["response"]["url"]
+                if "aisubtitle" in url.lower() and url not in ai_subtitle_urls:
+                    ai_subtitle_urls.append(url)
+        except:
+            continue
+
+
+def run(name, scan, video_logs):
+    """Time scan over every video log and report per-video cost and retained raw entries"""
+    start = time.perf_counter()
+    found, raw = scan(video_logs)
+    elapsed = time.perf_counter() - start
+    per_video = elapsed / len(video_logs) * 1000
+    # In a real crawl every get_log() call returns fresh entries, so retained entries are retained memory
+    retained = sum(len(entry["message"]) for entry in raw)
+    print(f"{name:<10} {per_video:8.2f} ms/video  found={found:<5} "
+          f"retained={len(raw)} entries / {retained / 1024 / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000, help="log entries per video")
+    parser.add_argument("--videos", type=int, default=20, help="number of videos")
+    args = parser.parse_args()
+
+    random.seed(0)
+    video_logs = [make_video_log(args.entries, i) for i in range(args.videos)]
+    print(f"{args.videos} videos x {args.entries} entries")
+
+    def legacy(logs_per_video):
+        raw = []
+        found = 0
+        for logs in logs_per_video:
+            urls = []
+            legacy_scan(logs, raw, urls)
+            found += len(urls)
+        return found, raw
+
+    def streaming(logs_per_video):
+        scanner = PerformanceLogScanner()
+        found = 0
+        for logs in logs_per_video:
+            scanner.reset()
+            found += len(scanner.scan(logs))
+        return found, scanner.raw
+
+    run("legacy", legacy, video_logs)
+    run("streaming", streaming, video_logs)
+
+
+if __name__ == "__main__":
+    main()
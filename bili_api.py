@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce
+from hashlib import md5
+from urllib.parse import urlencode
+from rate_limit import THROTTLE_CODES, THROTTLE_STATUSES
+from metrics import metrics
+import base64
+import math
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+API_BASE = "https://api.bilibili.com"
+# Video pages and user spaces, overridable to crawl a local stand-in site
+WWW_BASE = "https://www.bilibili.com"
+SPACE_BASE = "https://space.bilibili.com"
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+BVID_PATTERN = re.compile(r"BV[0-9A-Za-z]{10}")
+
+# Permutation used to derive the WBI mixin key from img_key + sub_key
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+]
+# Browser fingerprint parameters the space API expects, without them it answers -352
+DM_IMG_PARAMS = {
+    "dm_img_list": "[]",
+    "dm_img_str": base64.b64encode(b"WebGL 1.0 (OpenGL ES 2.0 Chromium)").decode()[:-2],
+    "dm_cover_img_str": base64.b64encode(
+        b"ANGLE (Intel, Intel(R) UHD Graphics 620 Direct3D11 vs_5_0 ps_5_0, D3D11)Google Inc. (Intel)").decode()[:-2],
+}
+
+
+class BilibiliApiError(Exception):
+    """Raised when a Bilibili API request fails or returns a non-zero code"""
+
+
+def extract_bvid(video):
+    """Return the BV id from a video URL or a bare BV id"""
+    match = BVID_PATTERN.search(video or "")
+    if not match:
+        raise BilibiliApiError(f"No BV id found in {video!r}")
+    return match.group(0)
+
+
+def bvid_url(bvid, base=WWW_BASE):
+    """Return the video page URL of a BV id, as the upload page links it"""
+    return f"{base.rstrip('/')}/video/{bvid}/"
+
+
+def normalize_url(url):
+    """Turn protocol-relative subtitle URLs into https URLs"""
+    if url.startswith("//"):
+        return "https:" + url
+    return url
+
+
+def is_ai_subtitle(subtitle):
+    """Return True for an AI generated entry of a subtitle list ({"lan", "url"} or player "subtitle_url")"""
+    url = subtitle.get("url") or subtitle.get("subtitle_url") or ""
+    return subtitle.get("lan", "").startswith("ai-") or "aisubtitle" in url.lower()
+
+
+def ai_subtitle_urls(parts):
+    """Return the AI subtitle URLs of all parts, in part order"""
+    urls = []
+    for part in parts:
+        for subtitle in part.get("subtitles") or []:
+            url = subtitle.get("url")
+            if url and is_ai_subtitle(subtitle) and url not in urls:
+                urls.append(url)
+    return urls
+
+
+class BilibiliApiClient:
+    """Small client for the JSON endpoints behind the video page
+
+    All requests go through one pooled requests.Session so connections are
+    reused across videos and worker threads. base_url can point at a local
+    stand-in server that mimics the endpoints. With an AdaptiveRateLimiter,
+    requests are paced per host and throttled ones are retried up to
+    throttle_retries times at the lowered rate.
+    """
+
+    def __init__(self, cookies=None, base_url=API_BASE, timeout=10, pool_size=10, limiter=None,
+                 throttle_retries=2):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limiter = limiter
+        self.throttle_retries = throttle_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Referer": "https://www.bilibili.com/",
+        })
+        if cookies:
+            self.set_cookies(cookies)
+        self.mixin_key = None
+        self.mixin_key_lock = threading.Lock()
+
+    def set_cookies(self, cookies):
+        """Load session cookies from Selenium cookie dicts or a name -> value mapping"""
+        if isinstance(cookies, dict):
+            cookies = [{"name": name, "value": value} for name, value in cookies.items()]
+        for cookie in cookies:
+            # Not bound to a domain so the cookies also reach a local stand-in server
+            self.session.cookies.set(cookie["name"], cookie["value"])
+
+    def request(self, path, params=None):
+        """GET an API path and return the decoded JSON payload"""
+        url = self.base_url + path
+        retries = self.throttle_retries if self.limiter is not None else 0
+        for attempt in range(retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire(url)
+            start = time.monotonic()
+            payload = None
+            try:
+                with metrics.span("api" + path):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                throttled = response.status_code in THROTTLE_STATUSES
+                if not throttled:
+                    response.raise_for_status()
+                    payload = response.json()
+                    throttled = payload.get("code") in THROTTLE_CODES
+            except (requests.RequestException, ValueError) as e:
+                # The host may refuse us by resetting the connection, other failures say nothing about the rate
+                if self.limiter is not None and isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    self.limiter.report(url, time.monotonic() - start, throttled=True)
+                raise BilibiliApiError(f"Request to {path} failed: {str(e)}") from e
+            if self.limiter is not None:
+                self.limiter.report(url, time.monotonic() - start, throttled=throttled)
+            if not throttled:
+                break
+
+        if payload is None:
+            raise BilibiliApiError(f"Request to {path} failed: throttled with HTTP {response.status_code}")
+        # A throttled API code is left for get() to report
+        return payload
+
+    def get(self, path, params=None):
+        """GET an API path and return its data field"""
+        payload = self.request(path, params)
+        if payload.get("code") != 0:
+            raise BilibiliApiError(f"{path} returned code {payload.get('code')}: {payload.get('message')}")
+        return payload.get("data") or {}
+
+    def get_video_info(self, bvid):
+        """Return the view info of a video, including its cid and parts"""
+        return self.get("/x/web-interface/view", {"bvid": bvid})
+
+    def get_player_info(self, bvid, cid):
+        """Return the player info of one part, including its subtitle list"""
+        return self.get("/x/player/v2", {"bvid": bvid, "cid": cid})
+
+    def get_subtitle_parts(self, video, workers=4):
+        """Resolve the subtitles of every part of a video URL or BV id without a browser
+
+        One view request lists the parts (分P), then the player info of all
+        parts is fetched concurrently. Returns [{"cid", "page", "part",
+        "subtitles": [{"lan", "lan_doc", "url"}]}] in part order, with every
+        subtitle language the player offers.
+        """
+        bvid = extract_bvid(video)
+        info = self.get_video_info(bvid)
+        pages = info.get("pages") or [{"cid": info.get("cid"), "page": 1, "part": info.get("title", "")}]
+        if not all(page.get("cid") for page in pages):
+            raise BilibiliApiError(f"No cid in view info of {bvid}")
+
+        if len(pages) == 1:
+            players = [self.get_player_info(bvid, pages[0]["cid"])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pages)))) as executor:
+                players = list(executor.map(lambda page: self.get_player_info(bvid, page["cid"]), pages))
+
+        parts = []
+        for index, (page, player) in enumerate(zip(pages, players), 1):
+            subtitles = []
+            for subtitle in (player.get("subtitle") or {}).get("subtitles") or []:
+                url = normalize_url(subtitle.get("subtitle_url") or "")
+                if url:
+                    subtitles.append({"lan": subtitle.get("lan", ""), "lan_doc": subtitle.get("lan_doc", ""),
+                                      "url": url})
+            parts.append({"cid": page["cid"], "page": page.get("page") or index, "part": page.get("part", ""),
+                          "subtitles": subtitles})
+        return parts
+
+    def get_ai_subtitle_urls(self, video):
+        """Resolve the AI subtitle URLs of all parts of a video URL or BV id without a browser"""
+        return ai_subtitle_urls(self.get_subtitle_parts(video))
+
+    def get_mixin_key(self):
+        """Return the WBI mixin key, fetching img_key/sub_key from nav once per client"""
+        with self.mixin_key_lock:
+            if self.mixin_key is None:
+                # nav answers -101 when logged out but still carries wbi_img
+                wbi_img = (self.request("/x/web-interface/nav").get("data") or {}).get("wbi_img") or {}
+                img_key = wbi_img.get("img_url", "").rsplit("/", 1)[-1].split(".")[0]
+                sub_key = wbi_img.get("sub_url", "").rsplit("/", 1)[-1].split(".")[0]
+                if not img_key or not sub_key:
+                    raise BilibiliApiError("nav returned no WBI keys")
+                raw = img_key + sub_key
+                self.mixin_key = reduce(lambda key, i: key + raw[i], MIXIN_KEY_ENC_TAB, "")[:32]
+            return self.mixin_key
+
+    def sign_wbi(self, params):
+        """Return params with the wts and w_rid WBI signature added"""
+        params = dict(params, wts=int(time.time()))
+        params = {key: "".join(c for c in str(value) if c not in "!'()*")
+                  for key, value in sorted(params.items())}
+        params["w_rid"] = md5((urlencode(params) + self.get_mixin_key()).encode()).hexdigest()
+        return params
+
+    def get_upload_page(self, mid, pn, ps=30):
+        """Return one page of a user's uploads, newest first"""
+        params = dict(DM_IMG_PARAMS, mid=mid, pn=pn, ps=ps, order="pubdate")
+        return self.get("/x/space/wbi/arc/search", self.sign_wbi(params))
+
+    def iter_upload_pages(self, mid, ps=30, workers=4, skip_pages=()):
+        """Yield (page number, videos, total pages) for every upload page of a user
+
+        The first page gives the real video count, the remaining pages are
+        fetched concurrently and yielded as they complete. Pages in
+        skip_pages (other than the first) are not fetched.
+        """
+        first = self.get_upload_page(mid, 1, ps)
+        count = (first.get("page") or {}).get("count") or 0
+        total_pages = max(1, math.ceil(count / ps))
+        yield 1, ((first.get("list") or {}).get("vlist") or []), total_pages
+
+        pages = [pn for pn in range(2, total_pages + 1) if pn not in skip_pages]
+        if not pages:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(self.get_upload_page, mid, pn, ps): pn for pn in pages}
+            for future in as_completed(futures):
+                data = future.result()
+                yield futures[future], ((data.get("list") or {}).get("vlist") or []), total_pages
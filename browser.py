@@ -0,0 +1,285 @@
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+from bili_api import USER_AGENT
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+HOME_URL = "https://www.bilibili.com/"
+COOKIE_FILE = "bilibili/cookies.json"
+
+# Resolved chromedriver path, reused offline until it is a week old
+DRIVER_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "bilibili_subtitle", "chromedriver.json")
+DRIVER_CACHE_MAX_AGE = 7 * 24 * 3600
+
+# Long-lived browser that crawl runs attach to with --attach
+SESSION_PORT = 9222
+SESSION_PROFILE = "bilibili/chrome-profile"
+CHROME_BINARIES = [
+    "google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome",
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+]
+
+# Requests a lean browser never makes: video/audio segments, images, fonts,
+# and telemetry. Subtitle JSON (aisubtitle.hdslb.com) and the player API stay allowed.
+BLOCKED_URLS = [
+    "*.m4s*", "*.flv*", "*.mp4*", "*bilivideo.com*", "*bilivideo.cn*", "*akamaized.net*", "*szbdyd.com*",
+    "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.avif*", "*.svg*",
+    "*.woff*", "*.ttf*", "*.otf*",
+    "*data.bilibili.com*", "*cm.bilibili.com*",
+]
+
+# True when a page load was answered with a captcha or risk control page
+CAPTCHA_CHECK_SCRIPT = """
+return /captcha|geetest/i.test(location.href)
+    || document.title.indexOf('验证码') >= 0
+    || !!document.querySelector('.geetest_panel, .geetest_holder, .bili-mini-captcha, iframe[src*="captcha"]');
+"""
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def get_driver_path(refresh=False):
+    """Return the chromedriver binary, resolving it over the network only when needed
+
+    The path is kept in memory for the process and in DRIVER_CACHE across
+    runs. A cache entry older than DRIVER_CACHE_MAX_AGE is refreshed, but
+    still used when the refresh fails, e.g. offline.
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is not None and not refresh:
+            return _driver_path
+
+        if not refresh:
+            try:
+                with open(DRIVER_CACHE, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if os.path.exists(cached["path"]):
+                    _driver_path = cached["path"]
+                    if time.time() - cached["resolved_at"] < DRIVER_CACHE_MAX_AGE:
+                        return _driver_path
+            except (OSError, ValueError, KeyError):
+                pass
+
+        try:
+            _driver_path = ChromeDriverManager().install()
+        except Exception:
+            if _driver_path is None or refresh:
+                raise
+            return _driver_path
+        try:
+            os.makedirs(os.path.dirname(DRIVER_CACHE), exist_ok=True)
+            with open(DRIVER_CACHE, "w", encoding="utf-8") as f:
+                json.dump({"path": _driver_path, "resolved_at": time.time()}, f)
+        except OSError:
+            pass
+        return _driver_path
+
+
+def create_driver(lean=False, attach=None):
+    """Start a Chrome instance with performance logging enabled
+
+    A lean browser runs headless with images disabled and blocks media,
+    image and font requests, see block_resources(). With attach
+    ("host:port") no browser is started; the driver connects to a running
+    one, see start_session().
+    """
+    options = webdriver.ChromeOptions()
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if attach:
+        options.debugger_address = attach
+    elif lean:
+        options.add_argument("--headless=new")
+        # The player only lays out its control bar with a real window size
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--mute-audio")
+        # Headless Chrome announces itself in the default user agent
+        options.add_argument(f"--user-agent={USER_AGENT}")
+    else:
+        options.add_argument("--start-maximized")
+    try:
+        driver = webdriver.Chrome(service=Service(get_driver_path()), options=options)
+    except SessionNotCreatedException:
+        # Chrome updated itself and no longer matches the cached driver
+        driver = webdriver.Chrome(service=Service(get_driver_path(refresh=True)), options=options)
+    if lean:
+        block_resources(driver)
+    return driver
+
+
+def find_chrome():
+    """Return the path of the installed Chrome binary"""
+    for name in CHROME_BINARIES:
+        path = shutil.which(name) or (name if os.path.isfile(name) else None)
+        if path:
+            return path
+    raise RuntimeError("Chrome not found, pass its path with --chrome")
+
+
+def start_session(port=SESSION_PORT, profile_dir=SESSION_PROFILE, lean=False, chrome=None):
+    """Launch a long-lived Chrome that crawl runs can attach to, return its "host:port"
+
+    The browser keeps running after this process exits and stores its
+    profile, including the login, in profile_dir. Attaching skips both
+    the browser cold start and the login.
+    """
+    args = [chrome or find_chrome(), f"--remote-debugging-port={port}",
+            f"--user-data-dir={os.path.abspath(profile_dir)}", "--no-first-run", "--no-default-browser-check"]
+    if lean:
+        args += ["--headless=new", "--window-size=1920,1080", "--blink-settings=imagesEnabled=false",
+                 "--mute-audio", f"--user-agent={USER_AGENT}"]
+    os.makedirs(profile_dir, exist_ok=True)
+    kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    subprocess.Popen(args + [HOME_URL], **kwargs)
+    return f"127.0.0.1:{port}"
+
+
+def block_resources(driver):
+    """Block BLOCKED_URLS in the current tab through DevTools
+
+    The block list belongs to a tab, so call this again after switching to
+    a newly opened one.
+    """
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+
+
+def is_captcha_page(driver):
+    """Return True when the current page is a captcha instead of the requested page"""
+    try:
+        return bool(driver.execute_script(CAPTCHA_CHECK_SCRIPT))
+    except Exception:
+        return False
+
+
+def open_page(driver, url, limiter=None):
+    """Load url, paced by limiter, and report any captcha to it"""
+    if limiter is None:
+        driver.get(url)
+        return
+    limiter.acquire(url)
+    driver.get(url)
+    # Loading a whole page routinely takes longer than the limiter's slow_latency, only a captcha is throttling
+    limiter.report(url, throttled=is_captcha_page(driver))
+
+
+def load_cookies(driver, cookies):
+    """Copy session cookies into a driver so it shares the logged-in session"""
+    if not cookies:
+        return
+    # Cookies can only be set for the domain of the current page
+    if not driver.current_url.startswith(HOME_URL):
+        driver.get(HOME_URL)
+    for cookie in cookies:
+        cookie = dict(cookie)
+        # Chrome rejects some sameSite values reported by get_cookies()
+        if cookie.get("sameSite") not in ("Strict", "Lax", "None"):
+            cookie.pop("sameSite", None)
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            continue
+    driver.refresh()
+
+
+def save_cookie_file(driver, path=COOKIE_FILE):
+    """Save the session cookies of a logged-in driver as a JSON cookie jar"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(driver.get_cookies(), f, ensure_ascii=False, indent=2)
+
+
+def is_logged_in(driver):
+    """Ask the nav API from inside the page whether the session is logged in"""
+    try:
+        return bool(driver.execute_script(
+            "return fetch('https://api.bilibili.com/x/web-interface/nav', {credentials: 'include'})"
+            ".then(function (r) { return r.json(); })"
+            ".then(function (j) { return !!(j.data && j.data.isLogin); });"))
+    except Exception:
+        return driver.get_cookie("SESSDATA") is not None
+
+
+def login(driver, cookie_file=COOKIE_FILE, interactive=True, log=print):
+    """Log the driver in from the saved cookie jar, or manually when that fails
+
+    An attached session that is already logged in is used as is. After a
+    manual login the cookies are saved to cookie_file so the next run,
+    including an unattended headless one, can skip it. Without
+    interactive a missing or expired cookie jar raises RuntimeError.
+    """
+    driver.get(HOME_URL)
+    if is_logged_in(driver):
+        log("Browser session is already logged in")
+        return
+
+    if cookie_file and os.path.exists(cookie_file):
+        with open(cookie_file, "r", encoding="utf-8") as f:
+            load_cookies(driver, json.load(f))
+        if is_logged_in(driver):
+            log(f"Logged in with cookies from {cookie_file}")
+            return
+        log(f"Cookies in {cookie_file} are no longer valid")
+
+    if not interactive:
+        raise RuntimeError(f"No valid cookies in {cookie_file}, log in once without --lean to save them")
+
+    # Wait for manual login on the Bilibili homepage
+    log("Opened Bilibili homepage, please login...")
+    log("Please complete login in the browser, then press Enter in the console to continue...")
+    input()
+    log("Login detected, continuing...")
+
+    if cookie_file:
+        save_cookie_file(driver, cookie_file)
+        log(f"Saved cookies to {cookie_file}")
+
+
+def add_browser_arguments(parser):
+    """Add the browser options shared by the crawler scripts, see browser_options()
+
+    --lean starts headless browsers with media blocked, which cannot show a
+    login page, so they log in from the cookie jar an earlier manual login
+    saved. --attach reuses a long-lived browser started with this script,
+    skipping browser startup and login on every run.
+    """
+    parser.add_argument("--lean", action="store_true",
+                        help="headless browsers with media blocked, logs in from the saved cookie jar")
+    parser.add_argument("--cookies", default=COOKIE_FILE, help="cookie jar saved after a manual login")
+    parser.add_argument("--attach", default=None, metavar="HOST:PORT",
+                        help="attach to a browser started with browser.py instead of launching one")
+
+
+def browser_options(args):
+    """Return the lean, cookie_file and attach arguments of the crawlers from parsed options"""
+    return {"lean": args.lean, "cookie_file": args.cookies, "attach": args.attach}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start a long-lived Chrome session for crawl runs to attach to")
+    parser.add_argument("--port", type=int, default=SESSION_PORT, help="remote debugging port")
+    parser.add_argument("--profile", default=SESSION_PROFILE, help="profile directory that keeps the login")
+    parser.add_argument("--lean", action="store_true", help="headless with images disabled")
+    parser.add_argument("--chrome", default=None, help="path of the Chrome binary")
+    args = parser.parse_args()
+
+    address = start_session(port=args.port, profile_dir=args.profile, lean=args.lean, chrome=args.chrome)
+    print(f"Chrome is listening on {address}")
+    print(f"Run the crawlers with --attach {address}, the first one logs in and the profile keeps the session")
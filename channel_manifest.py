@@ -0,0 +1,58 @@
+from bili_api import BVID_PATTERN
+import json
+import os
+import time
+
+
+def video_bvid(video):
+    """Return the BV id of a listed video, from its bvid field or its URL"""
+    if video.get("bvid"):
+        return video["bvid"]
+    match = BVID_PATTERN.search(video.get("url", ""))
+    return match.group(0) if match else None
+
+
+class ChannelManifest:
+    """Known uploads of one UP 主, newest first, kept in <directory>/<uid>.json
+
+    An incremental sync lists pages only until it meets a video of the
+    manifest, then merges the new videos in front of the known ones.
+    """
+
+    def __init__(self, uid, directory="bilibili/manifests"):
+        self.uid = str(uid)
+        self.path = os.path.join(directory, f"{self.uid}.json")
+        self.videos = []
+        self.synced_at = None
+
+    def load(self):
+        """Read the manifest if there is one, return self"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.videos = data.get("videos") or []
+            self.synced_at = data.get("synced_at")
+        except FileNotFoundError:
+            pass
+        return self
+
+    def known(self):
+        """Return the BV ids of all known videos"""
+        return {video_bvid(video) for video in self.videos} - {None}
+
+    def merge(self, new_videos):
+        """Put new_videos in front of the known videos, dropping older copies of them"""
+        new_ids = {video_bvid(video) for video in new_videos}
+        self.videos = list(new_videos) + [video for video in self.videos if video_bvid(video) not in new_ids]
+
+    def save(self):
+        """Write the manifest atomically"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.synced_at = time.time()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"uid": self.uid, "synced_at": self.synced_at, "videos": self.videos},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
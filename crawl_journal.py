@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import time
+
+
+class CrawlJournal:
+    """Append-only JSONL journal of processed items
+
+    Every record is written and flushed as soon as it is appended, and the
+    file is fsynced every fsync_every records or fsync_interval seconds,
+    whichever comes first. A record that was cut off by a crash is ignored
+    when the journal is read back.
+    """
+
+    def __init__(self, path, fsync_every=20, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def open(self, fresh=False):
+        """Open the journal for appending, or truncate it when fresh is set"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "w" if fresh else "a", encoding="utf-8")
+        # Terminate a line cut off by a crash so the next record starts cleanly
+        if not fresh and self.file.tell() > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+        return self
+
+    def append(self, record):
+        """Write one record and fsync periodically"""
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.pending += 1
+            if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        """Force written records to disk"""
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """Fsync and close the journal"""
+        with self.lock:
+            if self.file:
+                self.file.flush()
+                self.sync()
+                self.file.close()
+                self.file = None
+
+    def records(self):
+        """Return all complete records in the journal, oldest first"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Partial line from an interrupted write
+                    continue
+        return records
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,155 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import signal
+import threading
+import time
+
+# Setting this to a file path turns metrics on from the start of a run
+METRICS_ENV = "BILI_METRICS"
+METRICS_FILE = "bilibili/metrics.jsonl"
+
+
+class Metrics:
+    """Per-stage timing spans written as JSONL records
+
+    Each span appends {"time", "stage", "duration", "status", "video", ...}
+    to path. Spans opened inside a "video" span are attributed to that
+    video. While disabled, span() costs one attribute check, and it can be
+    switched on and off while a run is in progress (see toggle()).
+    summary() lists the stages and videos that took longest.
+    """
+
+    def __init__(self, path=None, enabled=False):
+        self.path = path or METRICS_FILE
+        self.enabled = enabled
+        self.file = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.video_durations = {}
+
+    def configure(self, path=None, enabled=True):
+        """Set the metrics file and switch recording on or off"""
+        with self.lock:
+            if path and path != self.path:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                self.path = path
+            self.enabled = enabled
+
+    def toggle(self, *args):
+        """Switch recording on or off, usable as a signal handler"""
+        self.enabled = not self.enabled
+        print(f"Metrics {'enabled' if self.enabled else 'disabled'}, writing to {self.path}")
+
+    @contextmanager
+    def span(self, stage, video=None, **fields):
+        """Time the enclosed block as stage"""
+        if not self.enabled:
+            yield
+            return
+        parent = getattr(self.local, "video", None)
+        if video is not None:
+            self.local.video = video
+        status = "ok"
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if video is not None:
+                self.local.video = parent
+            self.record(stage, duration, video=video or parent, status=status, **fields)
+
+    def record(self, stage, duration, video=None, status="ok", **fields):
+        """Write one timing record, e.g. for time summed over many small steps"""
+        if not self.enabled:
+            return
+        if video is None:
+            video = getattr(self.local, "video", None)
+        entry = {"time": round(time.time(), 3), "stage": stage, "duration": round(duration, 6), "status": status}
+        if video is not None:
+            entry["video"] = video
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.durations[stage].append(duration)
+            if status != "ok":
+                self.errors[stage] += 1
+            if stage == "video" and video is not None:
+                self.video_durations[video] = self.video_durations.get(video, 0.0) + duration
+            try:
+                if self.file is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self.file = open(self.path, "a", encoding="utf-8")
+                self.file.write(line)
+                self.file.flush()
+            except OSError:
+                pass
+
+    def summary(self, top=5):
+        """Return report lines for the slowest stages (by total time) and the slowest videos"""
+        with self.lock:
+            stages = sorted(self.durations.items(), key=lambda item: sum(item[1]), reverse=True)
+            videos = sorted(self.video_durations.items(), key=lambda item: item[1], reverse=True)[:top]
+            errors = dict(self.errors)
+        if not stages:
+            return []
+        lines = [f"{'stage':<24} {'count':>6} {'total s':>9} {'mean s':>8} {'p95 s':>8} {'max s':>8} {'errors':>6}"]
+        for stage, durations in stages:
+            ordered = sorted(durations)
+            p95 = ordered[max(0, -(-len(ordered) * 95 // 100) - 1)]
+            lines.append(f"{stage:<24} {len(ordered):>6} {sum(ordered):>9.2f} {sum(ordered) / len(ordered):>8.3f} "
+                         f"{p95:>8.3f} {ordered[-1]:>8.3f} {errors.get(stage, 0):>6}")
+        if videos:
+            lines.append(f"Slowest {len(videos)} videos:")
+            lines.extend(f"  {duration:8.2f}s  {video}" for video, duration in videos)
+        return lines
+
+    def close(self):
+        """Close the metrics file"""
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+# Shared by all crawlers of a process
+metrics = Metrics(path=os.environ.get(METRICS_ENV), enabled=bool(os.environ.get(METRICS_ENV)))
+
+
+def install_toggle_signal():
+    """Toggle metrics with SIGUSR1 (kill -USR1 <pid>) where the platform has it"""
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, metrics.toggle)
+
+
+def add_metrics_argument(parser):
+    """Add the --metrics option of the crawler scripts, see setup_metrics()"""
+    parser.add_argument("--metrics", nargs="?", const=METRICS_FILE, default=None, metavar="PATH",
+                        help=f"write per-stage timings as JSONL (default {METRICS_FILE}), SIGUSR1 toggles them")
+
+
+def setup_metrics(args):
+    """Switch metrics on as --metrics asks and let SIGUSR1 toggle them"""
+    if args.metrics:
+        metrics.configure(args.metrics)
+    install_toggle_signal()
+
+
+def log_summary(log=print, top=5):
+    """Log the metrics summary of the run, if anything was recorded"""
+    lines = metrics.summary(top)
+    if lines:
+        log(f"Timing summary, records in {metrics.path}:")
+        for line in lines:
+            log(line)
@@ -0,0 +1,416 @@
+"""Local stand-in for the parts of Bilibili the crawlers touch
+
+Serves from one origin:
+- /<uid>/upload/video   upload page with the bili-video-card DOM of test4.py, paged through arc/search
+- /video/<bvid>/        video page with the #bilibili-player subtitle button clicked by open_subtitle()
+- /x/web-interface/nav, /x/space/wbi/arc/search, /x/web-interface/view, /x/player/v2 and /x/player/wbi/v2
+- /aisubtitle/<bvid>_<page>_<lan>.json  AI subtitle bodies
+- /mock/stats           request and injected error counts
+
+JSON endpoints and subtitles answer after --latency seconds (plus up to
+--jitter) and fail with --error-status at --error-rate. Every UID has
+--videos uploads, --subtitle-rate of them with AI subtitles. Videos have
+1 to --max-parts parts, each with a subtitle in every --languages language.
+
+    python mock_bilibili.py --port 8000 --videos 200 --latency 0.05 --error-rate 0.02
+    python test4.py --listing api --api-base http://127.0.0.1:8000 --space-base http://127.0.0.1:8000 \\
+        --video-base http://127.0.0.1:8000
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from collections import Counter
+from hashlib import md5
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+BVID_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+UPLOAD_PATH = re.compile(r"^/(\d+)/upload/video/?$")
+VIDEO_PATH = re.compile(r"^/video/(BV[0-9A-Za-z]{10})/?$")
+SUBTITLE_PATH = re.compile(r"^/aisubtitle/(BV[0-9A-Za-z]{10})_(\d+)_([\w-]+)\.json$")
+LAN_DOCS = {"ai-zh": "中文（自动生成）", "ai-en": "English（自动生成）", "ai-ja": "日本語（自动生成）"}
+# Same file names as the live nav response, so the WBI mixin key is the known one
+WBI_IMG = {
+    "img_url": "https://i0.hdslb.com/bfs/wbi/7cd084941338484aae1ad9425b84077c.png",
+    "sub_url": "https://i0.hdslb.com/bfs/wbi/4932caff0ff746eab6f01bf08b70ac45.png",
+}
+
+# Cards are rendered from arc/search like the live upload page, with the same DOM path
+UPLOAD_PAGE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>测试UP主 {uid} 的个人空间 - 投稿视频</title>
+</head>
+<body>
+<div id="app">
+  <main>
+    <div class="space-upload">
+      <div class="upload-content">
+        <div>
+          <div class="video-body">
+            <div>
+              <div class="video-list grid-mode"></div>
+            </div>
+          </div>
+          <div class="video-footer">
+            <div>
+              <div class="vui_pagenation--btns"><button class="vui_button vui_pagenation--btn">上一页</button><button class="vui_button vui_pagenation--btn">1</button><button class="vui_button vui_pagenation--btn">2</button><button class="vui_button vui_pagenation--btn">3</button><button class="vui_button vui_pagenation--btn">4</button><button class="vui_button vui_pagenation--btn">5</button><button class="vui_button vui_pagenation--btn">6</button><button class="vui_button vui_pagenation--btn">7</button><button class="vui_button vui_pagenation--btn">...</button><button class="vui_button vui_pagenation--btn">{pages}</button><button class="vui_button vui_pagenation--btn">下一页</button></div>
+            </div>
+          </div>
+        </div>
+      </div>
+    </div>
+  </main>
+</div>
+<script>
+var MID = {uid}, PS = 40, page = 1;
+function esc(text) {{
+    return String(text).replace(/[&<>"]/g, function (c) {{
+        return {{'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}}[c];
+    }});
+}}
+function card(v) {{
+    var href = '/video/' + v.bvid + '/';
+    return '<div class="upload-video-card grid-mode"><div class="bili-video-card"><div class="bili-video-card__wrap">'
+        + '<div class="bili-video-card__cover-wrap"><div class="bili-video-card__cover"><a href="' + href + '" target="_blank">'
+        + '<div class="bili-cover-card__thumbnail"><img src="data:image/gif;base64,R0lGODlhAQABAAAAACw=" alt="' + esc(v.title) + '"></div>'
+        + '<div class="bili-cover-card__stats"><div class="bili-cover-card__stat"><span>' + v.play + '</span></div>'
+        + '<div class="bili-cover-card__stat"><span>' + v.length + '</span></div></div></a></div></div>'
+        + '<div class="bili-video-card__details"><div class="bili-video-card__title"><a href="' + href + '">' + esc(v.title) + '</a></div>'
+        + '<div class="bili-video-card__subtitle"><span>' + new Date(v.created * 1000).toISOString().slice(0, 10) + '</span></div>'
+        + '</div></div></div></div>';
+}}
+function load(pn) {{
+    fetch('/x/space/wbi/arc/search?mid=' + MID + '&pn=' + pn + '&ps=' + PS)
+        .then(function (r) {{ return r.json(); }})
+        .then(function (j) {{
+            var vlist = (j.data && j.data.list && j.data.list.vlist) || [];
+            document.querySelector('.video-list').innerHTML = vlist.map(card).join('');
+            page = pn;
+        }});
+}}
+document.querySelector('.vui_pagenation--btns').addEventListener('click', function (e) {{
+    var text = e.target.textContent;
+    if (text === '下一页') load(page + 1);
+    else if (text === '上一页') load(Math.max(1, page - 1));
+    else if (/^\\d+$/.test(text)) load(Number(text));
+}});
+load(1);
+</script>
+</body>
+</html>
+"""
+
+# The subtitle button appears once the player API answered, like on the live player
+VIDEO_PAGE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}_哔哩哔哩_bilibili</title>
+<style>
+#bilibili-player {{ width: 960px; height: 540px; background: #000; position: relative; }}
+.bpx-player-control-bottom-right {{ position: absolute; right: 10px; bottom: 10px; }}
+.bpx-player-ctrl-subtitle {{ display: none; width: 36px; height: 22px; color: #fff; cursor: pointer; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div id="bilibili-player">
+  <div>
+    <div class="bpx-player-container" data-ctrl-hidden="true">
+      <div class="bpx-player-primary-area">
+        <div class="bpx-player-video-area">
+          <div class="bpx-player-control-wrap">
+            <div class="bpx-player-control-entity">
+              <div class="bpx-player-control-bottom">
+                <div class="bpx-player-control-bottom-right">
+                  <div class="bpx-player-ctrl-btn bpx-player-ctrl-subtitle">字幕</div>
+                </div>
+              </div>
+            </div>
+          </div>
+        </div>
+      </div>
+    </div>
+  </div>
+</div>
+<script>
+var BVID = "{bvid}", CID = {cid}, subtitles = [];
+var button = document.querySelector('.bpx-player-ctrl-subtitle');
+fetch('/x/player/wbi/v2?bvid=' + BVID + '&cid=' + CID)
+    .then(function (r) {{ return r.json(); }})
+    .then(function (j) {{
+        subtitles = ((j.data || {{}}).subtitle || {{}}).subtitles || [];
+        button.style.display = 'block';
+    }});
+button.addEventListener('click', function () {{
+    if (subtitles.length) fetch(subtitles[0].subtitle_url);
+}});
+</script>
+</body>
+</html>
+"""
+
+
+def make_bvid(seed):
+    """Return a deterministic BV id for seed"""
+    rng = random.Random(seed)
+    return "BV1" + "".join(rng.choice(BVID_ALPHABET) for _ in range(9))
+
+
+def bvid_number(bvid, salt=""):
+    """Return a stable number derived from a BV id"""
+    return int(md5((salt + bvid).encode()).hexdigest()[:8], 16)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one write, unbuffered they hit the delayed ACK on kept-alive connections
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        """Keep request logging out of benchmark output"""
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path
+        if path == "/mock/stats":
+            return self.send_json(mock.stats())
+
+        dynamic = path.startswith("/x/") or path.startswith("/aisubtitle/")
+        mock.count(path, query)
+        mock.delay(mock.latency if dynamic else mock.page_latency)
+        if dynamic and mock.should_fail():
+            return self.send_body(mock.error_status, b"", "text/plain")
+
+        base = f"http://{self.headers.get('Host') or mock.address}"
+        if path == "/":
+            return self.send_html("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>哔哩哔哩</title></head>"
+                                  "<body>mock bilibili</body></html>")
+        if path == "/x/web-interface/nav":
+            return self.send_json({"code": 0, "message": "0", "data": {"isLogin": True, "wbi_img": WBI_IMG}})
+        if path == "/x/space/wbi/arc/search":
+            return self.send_json(mock.upload_page(query.get("mid", "0"), int(query.get("pn", 1)),
+                                                   int(query.get("ps", 30))))
+        if path == "/x/web-interface/view":
+            return self.send_json(mock.view(query.get("bvid", "")))
+        if path in ("/x/player/v2", "/x/player/wbi/v2"):
+            return self.send_json(mock.player(query.get("bvid", ""), int(query.get("cid", 0)), base))
+
+        match = SUBTITLE_PATH.match(path)
+        if match:
+            return self.send_json(mock.subtitle(match.group(1), int(match.group(2)), match.group(3)))
+        match = UPLOAD_PATH.match(path)
+        if match:
+            uid = match.group(1)
+            pages = max(1, -(-len(mock.catalog(uid)) // 40))
+            return self.send_html(UPLOAD_PAGE.format(uid=uid, pages=pages))
+        match = VIDEO_PATH.match(path)
+        if match:
+            bvid = match.group(1)
+            return self.send_html(VIDEO_PAGE.format(bvid=bvid, cid=bvid_number(bvid, "cid"),
+                                                    title=mock.titles.get(bvid, bvid)))
+        self.send_body(404, b"not found", "text/plain")
+
+    def send_json(self, payload):
+        """Send a JSON response"""
+        self.send_body(200, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def send_html(self, html):
+        """Send an HTML page"""
+        self.send_body(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def send_body(self, status, body, content_type):
+        """Send a complete response, keeping the connection open"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockBilibiliServer:
+    """Threaded local stand-in server, start() it or run this file"""
+
+    def __init__(self, host="127.0.0.1", port=0, videos=120, subtitle_rate=0.8, latency=0.0, jitter=0.0,
+                 page_latency=0.0, error_rate=0.0, error_status=412, seed=0, max_parts=1, languages=("ai-zh",)):
+        self.host = host
+        self.port = port
+        self.videos = videos
+        self.subtitle_rate = subtitle_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.page_latency = page_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self.max_parts = max(1, max_parts)
+        self.languages = list(languages)
+        self.catalogs = {}
+        self.titles = {}
+        self.requests = Counter()
+        # Query parameters of the latest request per endpoint, for checking what clients send
+        self.last_query = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def base_url(self):
+        return f"http://{self.address}"
+
+    def start(self):
+        """Serve in a background thread, return the base URL"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.port = self.httpd.server_address[1]
+        # A short poll interval keeps stop() quick
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        """Stop serving"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def count(self, path, query=None):
+        """Count a request by endpoint and remember its query"""
+        key = "/aisubtitle" if path.startswith("/aisubtitle/") else path
+        if UPLOAD_PATH.match(path):
+            key = "/upload"
+        elif VIDEO_PATH.match(path):
+            key = "/video"
+        with self.lock:
+            self.requests[key] += 1
+            self.last_query[key] = query or {}
+
+    def delay(self, seconds):
+        """Sleep for seconds plus up to jitter"""
+        if seconds > 0:
+            time.sleep(seconds + random.random() * self.jitter)
+
+    def should_fail(self):
+        """Return True when this response should be an injected error"""
+        if self.error_rate <= 0 or random.random() >= self.error_rate:
+            return False
+        with self.lock:
+            self.errors += 1
+        return True
+
+    def stats(self):
+        """Return request counts per endpoint and the number of injected errors"""
+        with self.lock:
+            return {"requests": dict(self.requests), "errors": self.errors}
+
+    def catalog(self, uid):
+        """Return the uploads of uid, newest first"""
+        with self.lock:
+            videos = self.catalogs.get(uid)
+            if videos is None:
+                now = int(time.time())
+                videos = []
+                for i in range(self.videos):
+                    # Keyed by upload number, so raising --videos adds new uploads in front of the same old ones
+                    bvid = make_bvid(f"{self.seed}:{uid}:{self.videos - i}")
+                    length = bvid_number(bvid, "length") % 3600 + 30
+                    videos.append({
+                        "bvid": bvid,
+                        "title": f"【第{self.videos - i}期】测试视频 {uid}-{self.videos - i}",
+                        "length": f"{length // 60:02d}:{length % 60:02d}",
+                        "play": bvid_number(bvid, "play") % 1000000,
+                        "created": now - i * 86400,
+                        "mid": int(uid),
+                    })
+                    self.titles[bvid] = videos[-1]["title"]
+                self.catalogs[uid] = videos
+            return videos
+
+    def has_subtitle(self, bvid):
+        """Return True for the fraction subtitle_rate of videos"""
+        return bvid_number(bvid, "subtitle") % 1000 < self.subtitle_rate * 1000
+
+    def upload_page(self, mid, pn, ps):
+        """Return an arc/search response"""
+        videos = self.catalog(mid)
+        vlist = videos[(pn - 1) * ps:pn * ps]
+        return {"code": 0, "message": "0",
+                "data": {"list": {"vlist": vlist}, "page": {"pn": pn, "ps": ps, "count": len(videos)}}}
+
+    def parts(self, bvid):
+        """Return the number of parts of bvid, their cids count up from bvid_number(bvid, "cid")"""
+        return bvid_number(bvid, "parts") % self.max_parts + 1
+
+    def view(self, bvid):
+        """Return a view response listing the parts of bvid"""
+        cid = bvid_number(bvid, "cid")
+        title = self.titles.get(bvid, bvid)
+        pages = [{"cid": cid + i, "page": i + 1, "part": title if i == 0 else f"{title} P{i + 1}"}
+                 for i in range(self.parts(bvid))]
+        return {"code": 0, "message": "0", "data": {"bvid": bvid, "cid": cid, "title": title, "pages": pages}}
+
+    def player(self, bvid, cid, base):
+        """Return a player response listing the AI subtitles of one part of bvid, if it has them"""
+        subtitles = []
+        page = cid - bvid_number(bvid, "cid") + 1
+        if self.has_subtitle(bvid) and 1 <= page <= self.parts(bvid):
+            expiry = int(time.time()) + 3600
+            signature = md5(f"{bvid}{expiry}".encode()).hexdigest()
+            for lan in self.languages:
+                subtitles.append({
+                    "id": bvid_number(bvid, f"subtitle_id{page}{lan}"),
+                    "lan": lan,
+                    "lan_doc": LAN_DOCS.get(lan, lan),
+                    "subtitle_url": f"{base}/aisubtitle/{bvid}_{page}_{lan}.json?auth_key={expiry}-0-0-{signature}",
+                })
+        return {"code": 0, "message": "0", "data": {"bvid": bvid, "subtitle": {"subtitles": subtitles}}}
+
+    def subtitle(self, bvid, page=1, lan="ai-zh"):
+        """Return a subtitle body of a few dozen cues"""
+        cues = []
+        prefix = bvid if page == 1 else f"{bvid} P{page}"
+        for i in range(bvid_number(bvid, f"cues{page}") % 60 + 20):
+            cues.append({"from": i * 3.0, "to": i * 3.0 + 2.5, "sid": i + 1, "location": 2,
+                         "content": f"{prefix} 的第 {i + 1} 句自动生成字幕" + ("" if lan == "ai-zh" else f" ({lan})")})
+        return {"font_size": 0.4, "font_color": "#FFFFFF", "background_alpha": 0.5, "background_color": "#9C27B0",
+                "Stroke": "none", "type": "AIsubtitle", "lang": "zh", "version": "v1.6.0.4", "body": cues}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the Bilibili pages and APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--videos", type=int, default=120, help="uploads per UID")
+    parser.add_argument("--subtitle-rate", type=float, default=0.8, help="fraction of videos with an AI subtitle")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before JSON and subtitle responses")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="seconds before HTML pages")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of JSON and subtitle requests that fail")
+    parser.add_argument("--error-status", type=int, default=412, help="HTTP status of injected errors")
+    parser.add_argument("--seed", type=int, default=0, help="changes the generated BV ids")
+    parser.add_argument("--max-parts", type=int, default=1, help="videos have 1 to this many parts")
+    parser.add_argument("--languages", default="ai-zh", help="comma separated subtitle languages of every part")
+    args = parser.parse_args()
+
+    mock = MockBilibiliServer(host=args.host, port=args.port, videos=args.videos, subtitle_rate=args.subtitle_rate,
+                              latency=args.latency, jitter=args.jitter, page_latency=args.page_latency,
+                              error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+                              max_parts=args.max_parts, languages=args.languages.split(","))
+    print(f"Mock Bilibili serving on {mock.start()}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
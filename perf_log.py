@@ -0,0 +1,56 @@
+import collections
+import json
+
+
+class PerformanceLogScanner:
+    """Streaming filter for Chrome performance log entries
+
+    Only messages that contain "aisubtitle" (or one of the watch substrings)
+    are parsed with json.loads, found URLs are deduped with a set, and at
+    most keep_raw raw entries are retained (none by default), so memory stays
+    flat over a long crawl. The raw check is a plain substring test: the
+    subtitle host aisubtitle.hdslb.com is always lower case in Chrome's log.
+    """
+
+    def __init__(self, keep_raw=0, watch=()):
+        self.raw = collections.deque(maxlen=keep_raw)
+        self.watch = tuple(watch)
+        self.seen = set()
+        self.watched = []
+
+    def reset(self):
+        """Forget found URLs and watched responses, e.g. before the next video"""
+        self.seen.clear()
+        self.watched.clear()
+
+    def scan(self, entries):
+        """Return the ai_subtitle URLs in entries that were not seen before
+
+        Responses whose URL contains a watch substring are collected as
+        (requestId, url) pairs, see pop_watched().
+        """
+        found = []
+        for entry in entries:
+            self.raw.append(entry)
+            message = entry.get("message", "")
+            if "aisubtitle" not in message and not (self.watch and any(w in message for w in self.watch)):
+                continue
+            try:
+                log = json.loads(message)["message"]
+                params = log["params"]
+                url = params["response"]["url"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if "aisubtitle" in url.lower():
+                if url not in self.seen:
+                    self.seen.add(url)
+                    found.append(url)
+            elif any(w in url for w in self.watch):
+                self.watched.append((params.get("requestId"), url))
+        return found
+
+    def pop_watched(self):
+        """Return and clear the watched responses collected so far"""
+        watched = self.watched
+        self.watched = []
+        return watched
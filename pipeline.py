@@ -0,0 +1,173 @@
+from browser import create_driver, login, add_browser_arguments, browser_options, COOKIE_FILE
+from test4 import BilibiliCrawler, list_channels, add_uid_arguments, uids_from_args, LISTING_WORKERS
+from test6 import BilibiliSubtitleCrawler
+from rate_limit import AdaptiveRateLimiter, add_rate_arguments, limiter_from_args
+from metrics import metrics, log_summary, add_metrics_argument, setup_metrics
+import argparse
+import os
+import queue
+import threading
+
+
+class BilibiliPipeline:
+    """List a user's uploads and capture their subtitles in one run
+
+    Listed videos flow through a bounded queue straight into the subtitle
+    workers, so capture starts while later pages are still being listed.
+    When the workers fall behind, the queue fills up and listing waits.
+    Login happens once in the listing browser; the subtitle workers copy its
+    session cookies. Listing and capture share one rate limiter, so the
+    whole run adapts to throttling together.
+    """
+
+    def __init__(self, workers=2, queue_size=None, listing="api", resolver="browser", api_base=None,
+                 capture_timeout=10, resume=False, lean=False, cookie_file=COOKIE_FILE, attach=None,
+                 limiter=None, incremental=False, listing_workers=LISTING_WORKERS):
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.lister_options = {"resume": resume, "listing": listing, "api_base": api_base, "lean": lean,
+                               "cookie_file": cookie_file, "attach": attach, "limiter": self.limiter,
+                               "incremental": incremental}
+        self.lister = BilibiliCrawler(**self.lister_options)
+        self.capturer = BilibiliSubtitleCrawler(workers=workers, resolver=resolver, api_base=api_base,
+                                                capture_timeout=capture_timeout, resume=resume,
+                                                lean=lean, cookie_file=cookie_file, limiter=self.limiter)
+        self.queue_size = queue_size or workers * 4
+        self.listing_workers = listing_workers
+        self.driver = None
+
+    def log(self, message):
+        """Print log message to console"""
+        print(message)
+
+    def run(self, uid):
+        """Execute the pipeline for one UP 主"""
+        self.run_batch([uid])
+
+    def run_batch(self, uids):
+        """Execute the pipeline for several UP 主 with one browser and one worker pool
+
+        With API listing up to listing_workers UIDs are listed at once, the
+        upload page is listed one UID at a time (see test4.list_channels).
+        The subtitle workers drain the shared queue meanwhile, so capture of
+        one channel overlaps with listing of the others. With more than one
+        UID each channel gets its own listing journal and video list in
+        bilibili/<uid>/; the subtitle results of all channels are saved
+        together.
+        """
+        listers = {}
+        try:
+            # Initialize WebDriver
+            with metrics.span("driver.start"):
+                self.driver = create_driver(lean=self.lister.lean, attach=self.lister.attach)
+            self.lister.driver = self.driver
+            self.capturer.driver = self.driver
+            self.log("Browser started")
+
+            # 1. Log in, from the saved cookie jar when possible
+            with metrics.span("login"):
+                login(self.driver, self.lister.cookie_file, interactive=not self.lister.lean, log=self.log)
+
+            # 2. Start subtitle workers on a bounded queue
+            completed = self.capturer.prepare()
+            tasks = queue.Queue(maxsize=self.queue_size)
+            # The logged-in driver stays with the listing, the workers start their own browsers
+            consumer = threading.Thread(target=self.capturer.run_workers, args=(tasks,),
+                                        kwargs={"share_driver": False, "cookies": self.driver.get_cookies()},
+                                        daemon=True)
+            consumer.start()
+
+            # 3. List videos and hand each one to the workers as soon as it is found
+            queued = set()
+            queued_lock = threading.Lock()
+
+            def on_video(video):
+                url = video.get("url")
+                with queued_lock:
+                    if url in completed or url in queued:
+                        return
+                    queued.add(url)
+                    index = len(queued)
+                self.put(tasks, (index, video), consumer)
+
+            listers = {uid: self.lister if len(uids) == 1 else self.lister_for(uid) for uid in uids}
+            for lister in listers.values():
+                lister.on_video = on_video
+            # A failed channel is logged and skipped, --resume picks it up later
+            listed = list_channels(listers, self.driver, self.listing_workers,
+                                   abort=lambda: not consumer.is_alive(), log=self.log)
+            # Incremental syncs only report the new videos
+            videos = [video for uid in listed
+                      for video in (listers[uid].new_videos if listers[uid].incremental else listers[uid].videos)]
+            self.log(f"Listing done, {len(queued)} videos of {len(uids)} UIDs queued for subtitles")
+
+            for _ in range(self.capturer.workers):
+                self.put(tasks, None, consumer)
+            consumer.join()
+
+            # 4. Save subtitle results in listing order
+            self.capturer.finish(videos)
+
+        except Exception as e:
+            self.log(f"Error occurred: {str(e)}")
+        finally:
+            self.capturer.close()
+            for lister in listers.values():
+                if lister.journal:
+                    lister.journal.close()
+            if self.driver:
+                self.driver.quit()
+                self.driver = None
+                self.log("Browser closed")
+            self.log("Pipeline completed")
+            log_summary(self.log)
+            metrics.close()
+
+    def lister_for(self, uid):
+        """Return a listing crawler that keeps its journal and video list in bilibili/<uid>/"""
+        data_dir = os.path.join("bilibili", str(uid))
+        return BilibiliCrawler(journal_path=os.path.join(data_dir, "videos.journal.jsonl"), data_dir=data_dir,
+                               **self.lister_options)
+
+    def put(self, tasks, item, consumer):
+        """Put item on the queue, waiting while it is full as long as the workers are alive"""
+        while True:
+            try:
+                tasks.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not consumer.is_alive():
+                    raise RuntimeError("All subtitle workers stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List a user's uploads and capture their AI subtitles in one run")
+    add_uid_arguments(parser)
+    parser.add_argument("--listing-workers", type=int, default=LISTING_WORKERS,
+                        help="UIDs listed at once through the API")
+    parser.add_argument("--workers", type=int, default=2, help="number of subtitle browser workers")
+    parser.add_argument("--queue-size", type=int, default=None, help="listed videos buffered ahead of the workers")
+    parser.add_argument("--listing", choices=["browser", "api"], default="api")
+    parser.add_argument("--resolver", choices=["browser", "http"], default="browser")
+    parser.add_argument("--api-base", default=None, help="override the API base URL, e.g. a local stand-in server")
+    parser.add_argument("--capture-timeout", type=float, default=10)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run from the journals")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only list and capture videos uploaded since the last sync of each UID")
+    add_browser_arguments(parser)
+    add_rate_arguments(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+    setup_metrics(args)
+
+    uids = uids_from_args(args)
+    invalid = [uid for uid in uids if not uid.isdigit()]
+    if invalid:
+        print(f"Error: Please enter valid UIDs (digits only): {invalid}")
+    else:
+        pipeline = BilibiliPipeline(workers=args.workers, queue_size=args.queue_size, listing=args.listing,
+                                    resolver=args.resolver, api_base=args.api_base,
+                                    capture_timeout=args.capture_timeout, resume=args.resume,
+                                    limiter=limiter_from_args(args), incremental=args.incremental,
+                                    listing_workers=args.listing_workers,
+                                    **browser_options(args))
+        pipeline.run_batch(uids)
@@ -0,0 +1,115 @@
+from urllib.parse import urlsplit
+import threading
+import time
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = {412, 429}
+# API codes for risk control (-352), blocked requests (-412) and "too frequent" (-509, -799)
+THROTTLE_CODES = {-352, -412, -509, -799}
+
+
+class HostBucket:
+    """Token bucket state of one host"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Consecutive throttled responses, each one doubles the pause
+        self.strikes = 0
+
+
+class AdaptiveRateLimiter:
+    """Token bucket per host whose rate adapts to how the host responds
+
+    Every host starts at rate requests per second with room for a burst of
+    burst requests. Each normal response raises the rate by increase, up to
+    max_rate. A throttled response (HTTP 412/429, risk control API codes or
+    a captcha page) multiplies it by decrease, down to min_rate, and pauses
+    the host for cooldown seconds, doubled for every further throttled
+    response in a row. Responses slower than slow_latency lower the rate
+    slightly, before the host starts refusing. The limiter is shared by
+    threads.
+    """
+
+    def __init__(self, rate=2.0, min_rate=0.1, max_rate=10.0, burst=2, increase=0.1, decrease=0.5,
+                 slow_latency=2.0, cooldown=5.0, max_cooldown=120.0):
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.burst = max(1, burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        """Print log message to console"""
+        print(message)
+
+    def bucket(self, url):
+        """Return the bucket of the host of url, call with the lock held"""
+        host = urlsplit(url).netloc or url
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = HostBucket(self.initial_rate, self.burst)
+        return bucket
+
+    def acquire(self, url):
+        """Wait until a request to the host of url may be sent"""
+        while True:
+            with self.lock:
+                bucket = self.bucket(url)
+                now = time.monotonic()
+                if now < bucket.paused_until:
+                    wait = bucket.paused_until - now
+                else:
+                    bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+                    bucket.updated = now
+                    if bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        return
+                    wait = (1 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+
+    def report(self, url, latency=None, throttled=False):
+        """Adjust the rate of the host of url from the outcome of one request"""
+        with self.lock:
+            bucket = self.bucket(url)
+            if throttled:
+                bucket.strikes += 1
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                pause = min(self.max_cooldown, self.cooldown * 2 ** (bucket.strikes - 1))
+                bucket.paused_until = time.monotonic() + pause
+                # Start from an empty bucket once the pause is over
+                bucket.tokens = 0
+                bucket.updated = bucket.paused_until
+                self.log(f"Throttled by {urlsplit(url).netloc or url}, "
+                         f"lowering rate to {bucket.rate:.2f}/s and pausing {pause:.1f}s")
+                return
+            bucket.strikes = 0
+            if latency is not None and latency > self.slow_latency:
+                bucket.rate = max(self.min_rate, bucket.rate * 0.9)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def rate(self, url):
+        """Return the current rate of the host of url in requests per second"""
+        with self.lock:
+            return self.bucket(url).rate
+
+
+def add_rate_arguments(parser):
+    """Add the --rate and --max-rate options of the limiter shared by a run, see limiter_from_args()"""
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="starting requests per second per host, adapted to throttling")
+    parser.add_argument("--max-rate", type=float, default=10.0, help="upper bound of the adapted rate")
+
+
+def limiter_from_args(args):
+    """Return the AdaptiveRateLimiter configured by parsed options"""
+    return AdaptiveRateLimiter(rate=args.rate, max_rate=args.max_rate)
@@ -0,0 +1,165 @@
+from urllib.parse import urlsplit, parse_qs
+from bili_api import is_ai_subtitle
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subtitles (
+    bvid TEXT NOT NULL,
+    cid INTEGER NOT NULL DEFAULT 0,
+    -- JSON list of the parts of the video with their subtitles, see BilibiliApiClient.get_subtitle_parts
+    parts TEXT NOT NULL,
+    expires_at REAL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (bvid, cid)
+);
+CREATE INDEX IF NOT EXISTS subtitles_last_access ON subtitles (last_access);
+CREATE TABLE IF NOT EXISTS subtitle_bodies (
+    url_key TEXT PRIMARY KEY,
+    bvid TEXT,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS subtitle_bodies_last_access ON subtitle_bodies (last_access);
+"""
+
+
+def url_expiry(url):
+    """Return the expiry timestamp of a signed subtitle URL, None if it is not signed
+
+    aisubtitle URLs carry auth_key=<expiry>-<rand>-<uid>-<md5>.
+    """
+    query = parse_qs(urlsplit(url).query)
+    for value in query.get("auth_key", []):
+        try:
+            return float(value.split("-", 1)[0])
+        except ValueError:
+            continue
+    return None
+
+
+def url_key(url):
+    """Identify a subtitle body by its URL without the signature, which changes per request"""
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+
+class SubtitleCache:
+    """On-disk SQLite cache of resolved subtitle URLs and downloaded subtitle bodies
+
+    The parts of a video with their subtitle URLs are keyed by BV id and
+    cid and honored until the earliest auth_key expiry of their URLs (minus
+    expiry_margin seconds). Videos without AI subtitles are cached for
+    empty_ttl seconds. Both tables are evicted least-recently-used first,
+    by entry count for parts and by total size for bodies. One connection
+    is shared by all worker threads.
+    """
+
+    def __init__(self, path="bilibili/subtitle_cache.sqlite3", max_entries=100000,
+                 max_body_bytes=512 * 1024 * 1024, empty_ttl=24 * 3600, expiry_margin=300):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.empty_ttl = empty_ttl
+        self.expiry_margin = expiry_margin
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def get(self, bvid, cid=0):
+        """Return the cached parts of a video, None on a miss or an expired entry"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT parts, expires_at FROM subtitles WHERE bvid = ? AND cid = ?",
+                (bvid, cid)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                self.db.execute("DELETE FROM subtitles WHERE bvid = ? AND cid = ?", (bvid, cid))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE subtitles SET last_access = ? WHERE bvid = ? AND cid = ?", (now, bvid, cid))
+            self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, bvid, parts, cid=0):
+        """Store the resolved parts of a video"""
+        now = time.time()
+        subtitles = [subtitle for part in parts for subtitle in part.get("subtitles") or []]
+        if any(is_ai_subtitle(subtitle) for subtitle in subtitles):
+            expiries = [url_expiry(subtitle.get("url", "")) for subtitle in subtitles]
+            expiries = [expiry for expiry in expiries if expiry is not None]
+            expires_at = min(expiries) - self.expiry_margin if expiries else None
+        else:
+            # A subtitle may still be generated later
+            expires_at = now + self.empty_ttl
+        if expires_at is not None and expires_at <= now:
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO subtitles (bvid, cid, parts, expires_at, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (bvid, cid, json.dumps(parts, ensure_ascii=False), expires_at, now, now))
+            self.evict_entries()
+            self.db.commit()
+
+    def get_body(self, url):
+        """Return a cached subtitle body for a subtitle URL, None on a miss"""
+        key = url_key(url)
+        with self.lock:
+            row = self.db.execute("SELECT body FROM subtitle_bodies WHERE url_key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE subtitle_bodies SET last_access = ? WHERE url_key = ?", (time.time(), key))
+            self.db.commit()
+        return row[0]
+
+    def put_body(self, url, body, bvid=None):
+        """Store a downloaded subtitle body"""
+        size = len(body.encode("utf-8"))
+        if size > self.max_body_bytes:
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO subtitle_bodies (url_key, bvid, body, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (url_key(url), bvid, body, size, time.time()))
+            self.evict_bodies()
+            self.db.commit()
+
+    def evict_entries(self):
+        """Drop expired parts, then the least recently used ones above max_entries"""
+        self.db.execute("DELETE FROM subtitles WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        count = self.db.execute("SELECT COUNT(*) FROM subtitles").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM subtitles WHERE rowid IN "
+                "(SELECT rowid FROM subtitles ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,))
+
+    def evict_bodies(self):
+        """Drop the least recently used bodies until the total size fits max_body_bytes"""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM subtitle_bodies").fetchone()[0]
+        if total <= self.max_body_bytes:
+            return
+        excess = total - self.max_body_bytes
+        victims = []
+        for key, size in self.db.execute("SELECT url_key, size FROM subtitle_bodies ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany("DELETE FROM subtitle_bodies WHERE url_key = ?", victims)
+
+    def close(self):
+        """Close the database"""
+        with self.lock:
+            self.db.close()
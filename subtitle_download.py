@@ -0,0 +1,207 @@
+from bili_api import extract_bvid, normalize_url, USER_AGENT
+from subtitle_cache import SubtitleCache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import argparse
+import json
+import os
+import random
+import re
+import requests
+import time
+
+# Responses worth retrying, anything else (e.g. 403 for an expired signature) fails at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+FORMATS = ("json", "srt", "vtt", "txt")
+
+
+def format_timestamp(seconds, separator=","):
+    """Format seconds as HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT)"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def to_srt(cues):
+    """Render subtitle cues ({"from", "to", "content"}) as SRT"""
+    blocks = []
+    for i, cue in enumerate(cues, 1):
+        blocks.append(f"{i}\n{format_timestamp(cue['from'])} --> {format_timestamp(cue['to'])}\n{cue['content']}\n")
+    return "\n".join(blocks)
+
+
+def to_vtt(cues):
+    """Render subtitle cues as WebVTT"""
+    blocks = ["WEBVTT\n"]
+    for cue in cues:
+        blocks.append(f"{format_timestamp(cue['from'], '.')} --> {format_timestamp(cue['to'], '.')}\n{cue['content']}\n")
+    return "\n".join(blocks)
+
+
+def to_text(cues):
+    """Render subtitle cues as plain text, one cue per line"""
+    return "".join(cue["content"] + "\n" for cue in cues)
+
+
+def safe_name(name):
+    """Make a string usable as a file or directory name"""
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_")[:80] or "video"
+
+
+class SubtitleDownloader:
+    """Download collected subtitle bodies concurrently and export them
+
+    All downloads share one requests.Session whose connection pool is sized
+    to the concurrency limit. Connection errors, 429 and 5xx responses are
+    retried with exponential backoff and jitter. When a SubtitleCache is
+    given, bodies are read from and written to it.
+    """
+
+    def __init__(self, output_dir="bilibili/subtitles", concurrency=8, retries=3, backoff=0.5,
+                 timeout=10, formats=FORMATS, cache=None):
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.formats = formats
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Referer": "https://www.bilibili.com/"})
+
+    def log(self, message):
+        """Print log message to console"""
+        print(message)
+
+    def jobs(self, videos):
+        """Yield (video directory name, file stem, url) for every collected subtitle URL
+
+        Subtitles of resolved parts are named p<page>_<lan>, e.g.
+        p2_ai-zh, results without parts number their ai_subtitle_urls.
+        """
+        for video in videos:
+            try:
+                name = extract_bvid(video.get("url", ""))
+            except Exception:
+                name = safe_name(video.get("alt", ""))
+            if video.get("parts") is None:
+                for i, url in enumerate(video.get("ai_subtitle_urls") or [], 1):
+                    yield name, str(i), normalize_url(url)
+                continue
+            for part in video["parts"]:
+                for i, subtitle in enumerate(part.get("subtitles") or [], 1):
+                    if subtitle.get("url"):
+                        yield (name, f"p{part.get('page') or 1}_{safe_name(subtitle.get('lan') or str(i))}",
+                               normalize_url(subtitle["url"]))
+
+    def download_all(self, videos):
+        """Download and export every subtitle of videos, return (succeeded, failed) counts"""
+        jobs = list(self.jobs(videos))
+        self.log(f"Downloading {len(jobs)} subtitles with {self.concurrency} workers")
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(lambda job: self.download(*job), jobs))
+        succeeded = sum(results)
+        failed = len(results) - succeeded
+        self.log(f"Downloaded {succeeded} subtitles ({failed} failed) in {time.monotonic() - start:.1f}s")
+        return succeeded, failed
+
+    def download(self, name, stem, url):
+        """Fetch one subtitle and write its exports, return True on success"""
+        try:
+            body = self.fetch(url, name)
+            self.export(name, stem, body)
+            return True
+        except Exception as e:
+            self.log(f"Failed to download subtitle {url}: {str(e)}")
+            return False
+
+    def fetch(self, url, bvid=None):
+        """Return the subtitle JSON text of url, retrying transient failures"""
+        if self.cache is not None:
+            body = self.cache.get_body(url)
+            if body is not None:
+                return body
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    body = response.text
+                    json.loads(body)
+                    break
+                error = f"HTTP {response.status_code}"
+            except requests.HTTPError:
+                raise
+            except (requests.RequestException, ValueError) as e:
+                error = str(e)
+            if attempt >= self.retries:
+                raise RuntimeError(f"giving up after {attempt + 1} attempts: {error}")
+            time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+            attempt += 1
+
+        if self.cache is not None:
+            self.cache.put_body(url, body, bvid)
+        return body
+
+    def export(self, name, stem, body):
+        """Write the requested formats of one subtitle to output_dir/name/stem.*"""
+        cues = json.loads(body).get("body") or []
+        directory = os.path.join(self.output_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        renderers = {"json": lambda: body, "srt": lambda: to_srt(cues), "vtt": lambda: to_vtt(cues),
+                     "txt": lambda: to_text(cues)}
+        for fmt in self.formats:
+            with open(os.path.join(directory, f"{stem}.{fmt}"), "w", encoding="utf-8") as f:
+                f.write(renderers[fmt]())
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download AI subtitles listed in videos_with_ai_subtitle.json")
+    parser.add_argument("--input", default="bilibili/videos_with_ai_subtitle.json")
+    parser.add_argument("--output", default="bilibili/subtitles")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated: " + ", ".join(FORMATS))
+    parser.add_argument("--cache", default="bilibili/subtitle_cache.sqlite3",
+                        help="subtitle cache database, pass an empty string to disable")
+    parser.add_argument("--index", default=None, metavar="PATH",
+                        help="update this subtitle search index with the downloaded files, see subtitle_index.py")
+    args = parser.parse_args()
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        print(f"Error: unknown formats {unknown}")
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            videos = json.load(f)
+        cache = SubtitleCache(args.cache) if args.cache else None
+        downloader = SubtitleDownloader(output_dir=args.output, concurrency=args.concurrency,
+                                        retries=args.retries, formats=formats, cache=cache)
+        try:
+            downloader.download_all(videos)
+        finally:
+            downloader.close()
+            if cache:
+                cache.close()
+
+        if args.index:
+            # Imported here, subtitle_index imports format_timestamp from this module
+            from subtitle_index import SubtitleIndex
+            index = SubtitleIndex(args.index)
+            try:
+                index.index_dir(args.output, args.input)
+            finally:
+                index.close()
@@ -0,0 +1,297 @@
+from bili_api import bvid_url, BVID_PATTERN
+from subtitle_download import format_timestamp
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    bvid TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cues (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cues_file ON cues (file_id);
+CREATE TABLE IF NOT EXISTS videos (
+    bvid TEXT PRIMARY KEY,
+    title TEXT,
+    url TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS cues_fts USING fts5(
+    content, content='cues', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS cues_insert AFTER INSERT ON cues BEGIN
+    INSERT INTO cues_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS cues_delete AFTER DELETE ON cues BEGIN
+    INSERT INTO cues_fts (cues_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS cues_short USING fts5(
+    grams, content='', prefix='1', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS cues_short_insert AFTER INSERT ON cues BEGIN
+    INSERT INTO cues_short (rowid, grams) VALUES (new.id, bigrams(new.content));
+END;
+CREATE TRIGGER IF NOT EXISTS cues_short_delete AFTER DELETE ON cues BEGIN
+    INSERT INTO cues_short (cues_short, rowid, grams) VALUES ('delete', old.id, bigrams(old.content));
+END;
+"""
+COMMIT_EVERY = 200
+# Subtitle files of resolved parts are named p<page>_<lan>, see SubtitleDownloader.jobs
+PART_STEM = re.compile(r"^p(\d+)_")
+
+
+def bigrams(text):
+    """Return the character pairs of every word of text and its last character, space separated
+
+    Indexed in cues_short, they let search() look up one and two character
+    terms, which the trigram index cannot: a two character term is one of
+    the pairs, a one character term starts a pair or ends a word.
+    """
+    grams = []
+    for word in text.split():
+        grams.extend(word[i:i + 2] for i in range(len(word) - 1))
+        grams.append(word[-1])
+    return " ".join(grams)
+
+
+def deep_link(url, seconds, page=None):
+    """Return url with the ?t= parameter that starts playback at seconds, and ?p= for parts after the first"""
+    params = f"p={page}&t={int(seconds)}" if page and page > 1 else f"t={int(seconds)}"
+    return f"{url}{'&' if '?' in url else '?'}{params}"
+
+
+def quote_term(term):
+    """Quote a search term as an FTS5 string"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+class SubtitleIndex:
+    """Persistent full-text index of downloaded subtitle cues
+
+    Every cue is stored with its video, start and end time in SQLite and
+    indexed with FTS5's trigram tokenizer, which matches any substring of
+    three or more characters and so needs no Chinese word segmentation.
+    Shorter terms, such as the many two character Chinese words, are looked
+    up in a second FTS5 index of character pairs (see bigrams()). Only
+    terms without any letter or digit fall back to a scan. index_dir()
+    only reads subtitle files that are new or changed since the last run.
+    """
+
+    def __init__(self, path="bilibili/subtitle_index.sqlite3"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Called by the cues_short triggers
+        self.db.create_function("bigrams", 1, bigrams, deterministic=True)
+        backfill = not self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'cues_short'").fetchone()
+        self.db.executescript(SCHEMA)
+        if backfill:
+            # Index created before cues_short existed
+            with self.db:
+                self.db.execute("INSERT INTO cues_short (rowid, grams) SELECT id, bigrams(content) FROM cues")
+
+    def log(self, message):
+        """Print log message to console"""
+        print(message)
+
+    def index_dir(self, subtitles_dir="bilibili/subtitles", videos_path=None, prune=True):
+        """Index new and changed <subtitles_dir>/<bvid>/*.json files, return the number of files read
+
+        Titles and URLs for deep links are read from videos_path (a
+        videos_with_ai_subtitle.json style list) when given. With prune,
+        files that were deleted are removed from the index.
+        """
+        if videos_path:
+            self.add_videos(videos_path)
+
+        known = {path: (file_id, mtime, size) for file_id, path, mtime, size
+                 in self.db.execute("SELECT id, path, mtime, size FROM files")}
+        seen = set()
+        indexed = 0
+        start = time.monotonic()
+        entries = sorted(os.scandir(subtitles_dir), key=lambda entry: entry.name) if os.path.isdir(subtitles_dir) else []
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            for file in os.scandir(entry.path):
+                if not file.name.endswith(".json"):
+                    continue
+                path = os.path.relpath(file.path, subtitles_dir)
+                seen.add(path)
+                stat = file.stat()
+                if path in known and known[path][1:] == (stat.st_mtime, stat.st_size):
+                    continue
+                try:
+                    with open(file.path, "r", encoding="utf-8") as f:
+                        cues = json.load(f).get("body") or []
+                except (OSError, ValueError) as e:
+                    self.log(f"Skipping unreadable subtitle {file.path}: {str(e)}")
+                    continue
+                self.replace_file(path, entry.name, file.name[:-len(".json")], stat.st_mtime, stat.st_size, cues)
+                indexed += 1
+                # One transaction per batch of files, committing each file is several times slower
+                if indexed % COMMIT_EVERY == 0:
+                    self.db.commit()
+
+        removed = 0
+        if prune:
+            for path in set(known) - seen:
+                self.remove_file(known[path][0])
+                removed += 1
+        self.db.commit()
+        self.log(f"Indexed {indexed} subtitle files, removed {removed}, in {time.monotonic() - start:.1f}s")
+        return indexed
+
+    def add_videos(self, videos_path):
+        """Store titles and URLs of the videos listed in videos_path"""
+        with open(videos_path, "r", encoding="utf-8") as f:
+            videos = json.load(f)
+        rows = []
+        for video in videos:
+            match = BVID_PATTERN.search(video.get("url", ""))
+            if match:
+                rows.append((match.group(0), video.get("alt", ""), video.get("url", "")))
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO videos (bvid, title, url) VALUES (?, ?, ?)", rows)
+
+    def replace_file(self, path, bvid, stem, mtime, size, cues):
+        """Replace the indexed cues of one subtitle file, commit() to persist"""
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+        if row:
+            self.remove_file(row[0])
+        file_id = self.db.execute(
+            "INSERT INTO files (path, bvid, stem, mtime, size) VALUES (?, ?, ?, ?, ?)",
+            (path, bvid, stem, mtime, size)).lastrowid
+        self.db.executemany(
+            "INSERT INTO cues (file_id, start, end, content) VALUES (?, ?, ?, ?)",
+            [(file_id, cue.get("from", 0), cue.get("to", 0), cue.get("content", "")) for cue in cues])
+
+    def remove_file(self, file_id):
+        """Drop one subtitle file and its cues from the index, commit() to persist"""
+        self.db.execute("DELETE FROM cues WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def search(self, query, limit=20, bvid=None):
+        """Return the best matching cues for all whitespace separated terms of query
+
+        Each hit has bvid, page, title, start, end, text and url, a deep
+        link to the moment the cue starts in its part.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        # The trigram index can only look up terms of three or more characters, cues_short the shorter ones
+        long_terms = [term for term in terms if len(term) >= 3]
+        short_terms = [term for term in terms if len(term) < 3]
+        indexed_terms = [term for term in short_terms if any(char.isalnum() for char in term)]
+        conditions = []
+        params = []
+        if long_terms:
+            conditions.append("cues_fts MATCH ?")
+            params.append(" ".join(quote_term(term) for term in long_terms))
+        if indexed_terms:
+            # One character terms are prefixes of the pairs
+            short_query = " ".join(quote_term(term) + ("*" if len(term) == 1 else "") for term in indexed_terms)
+            if long_terms:
+                conditions.append("c.id IN (SELECT rowid FROM cues_short WHERE cues_short MATCH ?)")
+            else:
+                conditions.append("cues_short MATCH ?")
+            params.append(short_query)
+        for term in short_terms:
+            # Pairs ignore case and punctuation, so the index only narrows down the cues
+            conditions.append("instr(c.content, ?) > 0")
+            params.append(term)
+        if bvid:
+            conditions.append("f.bvid = ?")
+            params.append(bvid)
+        # Without any indexed term the cues table is scanned
+        if long_terms:
+            source, order = "cues_fts JOIN cues c ON c.id = cues_fts.rowid", "cues_fts.rank"
+        elif indexed_terms:
+            source, order = "cues_short JOIN cues c ON c.id = cues_short.rowid", "cues_short.rank"
+        else:
+            source, order = "cues c", "c.id"
+        sql = (f"SELECT f.bvid, f.stem, c.start, c.end, c.content, v.title, v.url FROM {source} "
+               "JOIN files f ON f.id = c.file_id LEFT JOIN videos v ON v.bvid = f.bvid "
+               f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?")
+        params.append(limit)
+
+        hits = []
+        for video, stem, start, end, text, title, url in self.db.execute(sql, params):
+            if not url:
+                url = bvid_url(video) if BVID_PATTERN.fullmatch(video) else ""
+            match = PART_STEM.match(stem)
+            page = int(match.group(1)) if match else 1
+            hits.append({"bvid": video, "page": page, "title": title or "", "start": start, "end": end,
+                         "text": text, "url": deep_link(url, start, page) if url else ""})
+        return hits
+
+    def stats(self):
+        """Return the number of indexed videos, files and cues"""
+        videos, files = self.db.execute("SELECT COUNT(DISTINCT bvid), COUNT(*) FROM files").fetchone()
+        cues = self.db.execute("SELECT COUNT(*) FROM cues").fetchone()[0]
+        return {"videos": videos, "files": files, "cues": cues}
+
+    def optimize(self):
+        """Merge the FTS index segments, worth running after a large indexing run"""
+        with self.db:
+            self.db.execute("INSERT INTO cues_fts (cues_fts) VALUES ('optimize')")
+            self.db.execute("INSERT INTO cues_short (cues_short) VALUES ('optimize')")
+
+    def close(self):
+        """Close the database"""
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index downloaded subtitles and search what was said")
+    parser.add_argument("--index", default="bilibili/subtitle_index.sqlite3", help="index database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="index new and changed subtitle files")
+    update.add_argument("--subtitles", default="bilibili/subtitles", help="subtitle_download.py output directory")
+    update.add_argument("--videos", default="bilibili/videos_with_ai_subtitle.json",
+                        help="video list with titles and URLs, pass an empty string to skip")
+    update.add_argument("--optimize", action="store_true", help="merge index segments afterwards")
+    search = commands.add_parser("search", help="search indexed subtitles")
+    search.add_argument("query", help="terms that must all appear in a cue")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--bvid", default=None, help="only search this video")
+    args = parser.parse_args()
+
+    index = SubtitleIndex(args.index)
+    try:
+        if args.command == "update":
+            videos_path = args.videos if args.videos and os.path.exists(args.videos) else None
+            index.index_dir(args.subtitles, videos_path)
+            if args.optimize:
+                index.optimize()
+            stats = index.stats()
+            print(f"Index holds {stats['cues']} cues from {stats['files']} files of {stats['videos']} videos")
+        else:
+            start = time.perf_counter()
+            hits = index.search(args.query, limit=args.limit, bvid=args.bvid)
+            elapsed = (time.perf_counter() - start) * 1000
+            for hit in hits:
+                part = f" P{hit['page']}" if hit["page"] > 1 else ""
+                print(f"{format_timestamp(hit['start'])[:-4]}  {hit['bvid']}{part}  {hit['title']}")
+                print(f"    {hit['text']}")
+                print(f"    {hit['url']}")
+            print(f"{len(hits)} hits in {elapsed:.1f} ms")
+    finally:
+        index.close()
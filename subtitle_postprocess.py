@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+# A cue ending in one of these closes a sentence
+SENTENCE_END = "。！？!?…"
+
+
+def exclusive_cumsum(values):
+    """Return the running total before each element"""
+    totals = np.zeros(len(values), dtype=np.int64)
+    if len(values) > 1:
+        np.cumsum(values[:-1], out=totals[1:])
+    return totals
+
+
+def ranges(starts, lengths):
+    """Return the concatenated index ranges [start, start + length) as one array"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    return (np.arange(total, dtype=np.int64) - np.repeat(exclusive_cumsum(lengths), lengths)
+            + np.repeat(np.asarray(starts, dtype=np.int64), lengths))
+
+
+class CueTable:
+    """Subtitle cues of many videos held as columns
+
+    Row i is a cue of names[video[i]] from start[i] to end[i] seconds, and
+    its text is buffer[text_start[i]:text_end[i]]. Rows are sorted by video
+    and start time, and the texts are laid out in the buffer in row order,
+    joined by separator. The text of a run of consecutive rows is therefore
+    one buffer slice, so merge() and windows() produce their output from
+    index arithmetic on the columns without touching the strings.
+    """
+
+    def __init__(self, names, video, start, end, buffer, text_start, text_end, separator=""):
+        self.names = names
+        self.video = video
+        self.start = start
+        self.end = end
+        self.buffer = buffer
+        self.text_start = text_start
+        self.text_end = text_end
+        self.separator = separator
+        self._codepoints = None
+
+    @classmethod
+    def from_cues(cls, cues_by_name, separator=""):
+        """Build a table from (name, [{"from", "to", "content"}, ...]) pairs"""
+        names, video, start, end, texts = [], [], [], [], []
+        for name, cues in cues_by_name:
+            code = len(names)
+            names.append(name)
+            for cue in cues:
+                video.append(code)
+                start.append(cue.get("from", 0))
+                end.append(cue.get("to", 0))
+                texts.append(cue.get("content", ""))
+        video = np.array(video, dtype=np.int32)
+        start = np.array(start, dtype=np.float64)
+        end = np.array(end, dtype=np.float64)
+        order = np.lexsort((start, video))
+        texts = [texts[i] for i in order]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        text_start = exclusive_cumsum(lengths + len(separator))
+        return cls(names, video[order], start[order], end[order], separator.join(texts),
+                   text_start, text_start + lengths, separator)
+
+    @classmethod
+    def from_dir(cls, subtitles_dir="bilibili/subtitles", separator=""):
+        """Load every <bvid>/<stem>.json subtitle under subtitles_dir, named "<bvid>/<stem>\""""
+        def files():
+            if not os.path.isdir(subtitles_dir):
+                return
+            for entry in sorted(os.scandir(subtitles_dir), key=lambda entry: entry.name):
+                if not entry.is_dir():
+                    continue
+                for file in sorted(os.scandir(entry.path), key=lambda file: file.name):
+                    if file.name.endswith(".json"):
+                        with open(file.path, "r", encoding="utf-8") as f:
+                            yield f"{entry.name}/{file.name[:-len('.json')]}", json.load(f).get("body") or []
+        return cls.from_cues(files(), separator)
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def codepoints(self):
+        """The buffer as an array of code points, for vectorized text comparisons"""
+        if self._codepoints is None:
+            self._codepoints = np.frombuffer(self.buffer.encode("utf-32-le"), dtype="<u4")
+        return self._codepoints
+
+    def text(self, i):
+        """Return the text of row i"""
+        return self.buffer[self.text_start[i]:self.text_end[i]]
+
+    def derive(self, rows, start, end, text_start, text_end):
+        """Return a table of new rows whose texts are slices of this buffer"""
+        table = CueTable(self.names, self.video[rows], start, end, self.buffer, text_start, text_end, self.separator)
+        table._codepoints = self._codepoints
+        return table
+
+    def take(self, rows, end=None):
+        """Return the rows at the sorted indices rows, with a compacted buffer"""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.text_end[rows] - self.text_start[rows]
+        separator = np.frombuffer(self.separator.encode("utf-32-le"), dtype="<u4")
+        text_start = exclusive_cumsum(lengths + len(separator))
+        size = int(lengths.sum()) + len(separator) * max(0, len(rows) - 1)
+        chars = np.empty(size, dtype="<u4")
+        chars[ranges(text_start, lengths)] = self.codepoints[ranges(self.text_start[rows], lengths)]
+        for i, char in enumerate(separator):
+            chars[text_start[:-1] + lengths[:-1] + i] = char
+        return CueTable(self.names, self.video[rows], self.start[rows], self.end[rows] if end is None else end,
+                        chars.tobytes().decode("utf-32-le"), text_start, text_start + lengths, self.separator)
+
+    def dedupe(self, tolerance=0.05):
+        """Drop cues repeating the text of the cue before them while overlapping or touching it
+
+        The kept cue is extended to the end of its repeats.
+        """
+        if len(self) < 2:
+            return self
+        lengths = self.text_end - self.text_start
+        candidates = np.flatnonzero((self.video[1:] == self.video[:-1]) & (lengths[1:] == lengths[:-1])
+                                    & (self.start[1:] <= self.end[:-1] + tolerance)) + 1
+        duplicate = np.zeros(len(self), dtype=bool)
+        empty = candidates[lengths[candidates] == 0]
+        duplicate[empty] = True
+        candidates = candidates[lengths[candidates] > 0]
+        if len(candidates):
+            # Compare the texts of all candidate pairs in one pass over their code points
+            pair_lengths = lengths[candidates]
+            same = (self.codepoints[ranges(self.text_start[candidates], pair_lengths)]
+                    == self.codepoints[ranges(self.text_start[candidates - 1], pair_lengths)])
+            duplicate[candidates] = np.logical_and.reduceat(same, exclusive_cumsum(pair_lengths))
+        if not duplicate.any():
+            return self
+        keep = np.flatnonzero(~duplicate)
+        return self.take(keep, end=np.maximum.reduceat(self.end, keep))
+
+    def gaps(self, min_gap=2.0):
+        """Return (names, gap starts, gap ends) of silences of at least min_gap seconds between cues"""
+        gap = self.start[1:] - self.end[:-1]
+        rows = np.flatnonzero((self.video[1:] == self.video[:-1]) & (gap >= min_gap))
+        return [self.names[code] for code in self.video[rows]], self.end[rows], self.start[rows + 1]
+
+    def merge(self, max_gap=0.8, max_chars=60, sentence_end=SENTENCE_END):
+        """Merge consecutive cues into sentences
+
+        A new sentence starts at a new video, after a pause longer than
+        max_gap seconds, after a cue ending in sentence_end, and once the
+        sentence has reached about max_chars characters.
+        """
+        if len(self) == 0:
+            return self
+        lengths = self.text_end - self.text_start
+        # Only cues with text have a last character, the buffer is empty when none has
+        last_chars = np.zeros(len(self), dtype="<u4")
+        texts = np.flatnonzero(lengths > 0)
+        last_chars[texts] = self.codepoints[self.text_end[texts] - 1]
+        stops = np.array([ord(char) for char in sentence_end], dtype="<u4")
+        boundary = np.ones(len(self), dtype=bool)
+        boundary[1:] = ((self.video[1:] != self.video[:-1]) | (self.start[1:] - self.end[:-1] > max_gap)
+                        | np.isin(last_chars[:-1], stops))
+        if max_chars:
+            # Characters before each cue within its sentence, split where that crosses a multiple of max_chars
+            heads = np.flatnonzero(boundary)
+            sentence = np.cumsum(boundary) - 1
+            before = exclusive_cumsum(lengths)
+            before -= before[heads][sentence]
+            bucket = before // max_chars
+            boundary[1:] |= bucket[1:] != bucket[:-1]
+        heads = np.flatnonzero(boundary)
+        lasts = np.append(heads[1:] - 1, len(self) - 1)
+        return self.derive(heads, self.start[heads], np.maximum.reduceat(self.end, heads),
+                           self.text_start[heads], self.text_end[lasts])
+
+    def windows(self, window=30.0, stride=None):
+        """Resegment each video into fixed windows of window seconds, stride seconds apart
+
+        A cue belongs to every window its start falls into. Empty windows
+        are dropped.
+        """
+        if len(self) == 0:
+            return self
+        stride = stride or window
+        video_heads = np.flatnonzero(np.r_[True, self.video[1:] != self.video[:-1]])
+        video_codes = self.video[video_heads]
+        video_ends = np.maximum.reduceat(self.end, video_heads)
+        counts = (np.ceil(np.maximum(video_ends - window, 0) / stride) + 1).astype(np.int64)
+        window_video = np.repeat(video_codes, counts)
+        window_start = (np.arange(counts.sum()) - np.repeat(exclusive_cumsum(counts), counts)) * stride
+        window_end = np.minimum(window_start + window, np.repeat(video_ends, counts))
+
+        # Rows are sorted by (video, start), so one key orders them for searchsorted
+        scale = float(video_ends.max()) + window + 1
+        keys = self.video * scale + self.start
+        lo = np.searchsorted(keys, window_video * scale + window_start, side="left")
+        hi = np.searchsorted(keys, window_video * scale + window_start + window, side="left")
+        filled = hi > lo
+        lo, hi = lo[filled], hi[filled]
+        return self.derive(lo, window_start[filled], window_end[filled], self.text_start[lo], self.text_end[hi - 1])
+
+    def records(self):
+        """Yield the rows as {"video", "from", "to", "content"} dicts"""
+        for i in range(len(self)):
+            yield {"video": self.names[self.video[i]], "from": round(float(self.start[i]), 3),
+                   "to": round(float(self.end[i]), 3), "content": self.text(i)}
+
+    def write_jsonl(self, path):
+        """Write the rows as JSON lines"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in self.records():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge, de-duplicate and resegment downloaded subtitles")
+    parser.add_argument("--subtitles", default="bilibili/subtitles", help="subtitle_download.py output directory")
+    parser.add_argument("--mode", choices=["sentences", "windows"], default="sentences")
+    parser.add_argument("--output", default=None, help="JSONL output, default bilibili/<mode>.jsonl")
+    parser.add_argument("--separator", default="", help="text put between merged cues, e.g. a space for English")
+    parser.add_argument("--max-gap", type=float, default=0.8, help="longest pause inside a sentence, seconds")
+    parser.add_argument("--max-chars", type=int, default=60, help="approximate longest sentence")
+    parser.add_argument("--window", type=float, default=30.0, help="window length in seconds")
+    parser.add_argument("--stride", type=float, default=None, help="seconds between window starts, default --window")
+    parser.add_argument("--min-gap", type=float, default=5.0, help="report silences at least this long")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = CueTable.from_dir(args.subtitles, separator=args.separator)
+    print(f"Loaded {len(table)} cues of {len(table.names)} subtitles in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    deduped = table.dedupe()
+    gap_names, _, _ = deduped.gaps(args.min_gap)
+    if args.mode == "sentences":
+        result = deduped.merge(max_gap=args.max_gap, max_chars=args.max_chars)
+    else:
+        result = deduped.windows(window=args.window, stride=args.stride)
+    print(f"Removed {len(table) - len(deduped)} repeated cues, found {len(gap_names)} silences of "
+          f"{args.min_gap}s or more, built {len(result)} {args.mode} in {time.perf_counter() - start:.2f}s")
+
+    output = args.output or f"bilibili/{args.mode}.jsonl"
+    result.write_jsonl(output)
+    print(f"Saved {len(result)} {args.mode} to {output}")
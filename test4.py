@@ -1,17 +1,132 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from browser import (create_driver, login, open_page, is_captcha_page, add_browser_arguments, browser_options,
+                     COOKIE_FILE)
+from crawl_journal import CrawlJournal
+from bili_api import BilibiliApiClient, API_BASE, SPACE_BASE, WWW_BASE, bvid_url
+from channel_manifest import ChannelManifest, video_bvid
+from upload_page import extract_cards
+from rate_limit import AdaptiveRateLimiter, add_rate_arguments, limiter_from_args
+from metrics import metrics, log_summary, add_metrics_argument, setup_metrics
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import math
+import os
 import time
 import json
 
+# Channels listed at once through the API, browser listing is always one channel at a time
+LISTING_WORKERS = 4
+
+
+def add_uid_arguments(parser):
+    """Add the --uid, --uids and --uid-file options, see uids_from_args()"""
+    parser.add_argument("--uid", default=None, help="UP 主 UID, prompted for when no UID is given")
+    parser.add_argument("--uids", default=None, help="comma separated UIDs to crawl in one batch")
+    parser.add_argument("--uid-file", default=None, help="file with one UID per line, # starts a comment")
+
+
+def uids_from_args(args):
+    """Return the UIDs given on the command line, in order without repeats, prompting when there are none"""
+    uids = []
+    if args.uids:
+        uids += [uid.strip() for uid in args.uids.split(",") if uid.strip()]
+    if args.uid_file:
+        with open(args.uid_file, "r", encoding="utf-8") as f:
+            uids += [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+    if args.uid:
+        uids.append(args.uid)
+    if not uids:
+        uids = [input("Enter UP 主 UID (default: 666759136): ").strip() or "666759136"]
+    # Keep the first occurrence of each UID
+    return list(dict.fromkeys(uids))
+
+
+def list_channels(listers, driver, workers=LISTING_WORKERS, abort=None, log=print):
+    """List every channel of listers ({uid: BilibiliCrawler}) with one logged-in driver, return the listed UIDs
+
+    Channels listed through the API are listed concurrently on up to
+    workers threads, which share the session cookies and the rate limiter
+    of their listers. A driver cannot be shared between threads, so
+    channels whose API listing fails are listed through the upload page
+    afterwards, one at a time, keeping the pages the API did list, and
+    browser listing is serial throughout. Each listed channel is saved.
+    When abort() returns True, a listing error is raised instead of logged.
+    """
+    def list_one(uid, browser_fallback):
+        lister = listers[uid]
+        lister.driver = driver
+        try:
+            with metrics.span("listing", uid=uid):
+                lister.list_videos(uid, browser_fallback=browser_fallback)
+            lister.save_data()
+            return True
+        except Exception as e:
+            if abort is not None and abort():
+                raise
+            log(f"Listing UID {uid} failed: {str(e)}" + ("" if browser_fallback else ", retrying after the others"))
+            return False
+        finally:
+            if lister.journal:
+                lister.journal.close()
+
+    listed = set()
+    concurrent = [uid for uid, lister in listers.items() if lister.listing == "api"]
+    if len(concurrent) > 1:
+        cookies = driver.get_cookies()
+        for uid in concurrent:
+            listers[uid].cookies = cookies
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(concurrent)))) as executor:
+            for uid, ok in zip(concurrent, executor.map(lambda uid: list_one(uid, False), concurrent)):
+                if ok:
+                    listed.add(uid)
+                else:
+                    # Keep the pages the API did list
+                    listers[uid].resume = True
+    for uid in listers:
+        if uid not in listed and list_one(uid, True):
+            listed.add(uid)
+    return [uid for uid in listers if uid in listed]
+
+
 class BilibiliCrawler:
-    def __init__(self):
+    def __init__(self, resume=False, journal_path="bilibili/{uid}/videos.journal.jsonl", listing="browser",
+                 api_base=None, lean=False, cookie_file=COOKIE_FILE,
+                 attach=None, limiter=None, data_dir="bilibili", space_base=None, video_base=None,
+                 incremental=False, manifest_dir="bilibili/manifests"):
         self.driver = None
         self.logs = []
-        self.videos = []  # 存储所有视频信息，每个元素是 {"alt": alt_name, "url": video_url}
+        self.videos = []  # 存储所有视频信息，每个元素是 {"alt": alt_name, "url": video_url, "bvid", "duration", "published"}
+        # Every listed video is appended to the journal, --resume skips pages already listed.
+        # {uid} in the path is replaced by the listed UID, so a resumed run never reuses another channel's pages
+        self.resume = resume
+        self.journal_path = journal_path
+        self.journal = None
+        self.listing = listing  # "browser" or "api"
+        self.api_base = api_base
+        # Session cookies for API listing, read from the driver when not set
+        self.cookies = None
+        # Upload pages and video links, overridable to crawl a local stand-in site
+        self.space_base = space_base or SPACE_BASE
+        self.video_base = video_base or WWW_BASE
+        # Called with each video as soon as it is listed, e.g. to feed subtitle workers
+        self.on_video = None
+        # Browser options, see browser.add_browser_arguments
+        self.lean = lean
+        self.cookie_file = cookie_file
+        self.attach = attach
+        # Shared with the other crawlers of the same run
+        self.limiter = limiter or AdaptiveRateLimiter()
+        # videos.json and videos.txt are written here
+        self.data_dir = data_dir
+        # Incremental sync lists pages until it meets a video known from the manifest of the UID
+        self.incremental = incremental
+        self.manifest_dir = manifest_dir
+        self.known = None
+        self.reached_known = False
+        self.listing_complete = False
+        self.new_videos = []
 
     def log(self, message):
         """Print log message to console"""
@@ -19,121 +134,292 @@ class BilibiliCrawler:
 
     def crawl(self, uid):
         """Execute crawling logic"""
+        self.crawl_channels({uid: self})
+
+    def crawl_channels(self, listers, workers=LISTING_WORKERS):
+        """List the channels of listers ({uid: BilibiliCrawler}) with this crawler's browser, see list_channels()"""
         try:
             # Initialize WebDriver
-            options = webdriver.ChromeOptions()
-            options.add_argument("--start-maximized")
-            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
-            self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+            with metrics.span("driver.start"):
+                self.driver = create_driver(lean=self.lean, attach=self.attach)
             self.log("Browser started")
 
-            # 1. Go to Bilibili homepage
-            self.driver.get("https://www.bilibili.com/")
-            self.log("Opened Bilibili homepage, please login...")
+            # 1. Log in, from the saved cookie jar when possible
+            with metrics.span("login"):
+                login(self.driver, self.cookie_file, interactive=not self.lean, log=self.log)
+
+            # 2. List all pages of every channel
+            listed = list_channels(listers, self.driver, workers, log=self.log)
+            if len(listers) > 1:
+                self.log(f"Listed {len(listed)} of {len(listers)} UIDs")
+
+        except Exception as e:
+            self.log(f"Error occurred: {str(e)}")
+        finally:
+            for lister in listers.values():
+                if lister.journal:
+                    lister.journal.close()
+            self.quit_browser()
+            self.log("Crawling completed")
+            log_summary(self.log)
+            metrics.close()
+
+    def list_videos(self, uid, browser_fallback=True):
+        """List every upload of uid into self.videos, journaling each page
+
+        In incremental mode only videos missing from the manifest are
+        journaled and passed to on_video; they end up in self.new_videos,
+        and self.videos is the updated manifest. Without browser_fallback a
+        failed API listing raises instead of using the upload page.
+        """
+        manifest = None
+        self.known = None
+        self.reached_known = False
+        self.listing_complete = False
+        if self.incremental:
+            manifest = ChannelManifest(uid, self.manifest_dir).load()
+            self.known = manifest.known()
+            self.log(f"Incremental sync: {len(self.known)} videos already known")
+
+        # --resume skips pages already listed
+        self.journal = CrawlJournal(self.journal_path.format(uid=uid))
+        done_pages = self.completed_pages() if self.resume else set()
+        if self.resume:
+            self.log(f"Resuming: pages {sorted(done_pages)} already listed")
+            if self.on_video:
+                for video in self.videos_from_journal():
+                    self.on_video(video)
+        self.journal.open(fresh=not self.resume)
+
+        listed = False
+        if self.listing == "api":
+            listed = self.list_with_api(uid, done_pages)
+            if not listed:
+                if not browser_fallback:
+                    self.journal.close()
+                    raise RuntimeError("API listing failed")
+                self.log("Falling back to the upload page")
+        if not listed:
+            # Pages the API listed before failing are not listed again
+            self.list_with_browser(uid, self.completed_pages())
+
+        self.journal.close()
 
-            # 2. Wait for manual login
-            self.log("Please complete login in the browser, then press Enter in the console to continue...")
-            input()
-            self.log("Login detected, continuing...")
+        # Build the video list from the journal so pages of earlier runs are included
+        self.videos = self.videos_from_journal()
+        if manifest is not None:
+            self.new_videos = self.videos
+            self.log(f"Found {len(self.new_videos)} new videos")
+            manifest.merge(self.new_videos)
+            self.videos = manifest.videos
+            # An interrupted listing may have missed new videos behind the ones it found
+            if self.listing_complete:
+                manifest.save()
+            else:
+                self.log("Listing did not reach known videos or the last page, manifest not updated")
+        return self.videos
 
-            # 3. Go to upload video page
-            upload_url = f"https://space.bilibili.com/{uid}/upload/video"
-            self.driver.get(upload_url)
-            self.log(f"Navigated to upload video page: {upload_url}")
+    def add_video(self, page, video):
+        """Record one listed video, in incremental mode only if it is new"""
+        if self.known is not None and video_bvid(video) in self.known:
+            self.reached_known = True
+            return
+        self.videos.append(video)
+        self.journal.append({"page": page, "video": video})
+        if self.on_video:
+            self.on_video(video)
+
+    def list_with_browser(self, uid, done_pages):
+        """List upload pages by clicking through the pagination of the upload page"""
+        # 1. Go to upload video page
+        upload_url = f"{self.space_base.rstrip('/')}/{uid}/upload/video"
+        with metrics.span("upload.open"):
+            open_page(self.driver, upload_url, self.limiter)
+        self.log(f"Navigated to upload video page: {upload_url}")
+        with metrics.span("upload.sleep"):
             time.sleep(5)
 
-            # 4. Wait for page to load
+        # 2. Wait for page to load
+        with metrics.span("upload.wait"):
             WebDriverWait(self.driver, 10).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "#app > main > div.space-upload > div.upload-content"))
             )
-            self.log("Page loaded, searching for elements...")
+        self.log("Page loaded, searching for elements...")
+
+        # 3. Crawl all pages
+        current_page = 1
+        total_pages = 15  # 假设总共有15页
+        
+        while current_page <= total_pages:
+            self.log(f"Processing page {current_page}/{total_pages}")
+
+            if current_page in done_pages:
+                self.log("Page already listed, skipping")
+                found = True
+            else:
+                with metrics.span("upload.extract", page=current_page):
+                    found = self.list_page(current_page)
+
+            if not found:
+                self.log("No matching elements found on this page")
+                self.listing_complete = True
+                break
 
-            # 5. Crawl all pages
-            current_page = 1
-            total_pages = 15  # 假设总共有15页
+            if self.reached_known:
+                self.log("Reached videos known from the last sync, stopping")
+                self.listing_complete = True
+                break
+
+            # Save data after each page
             
-            while current_page <= total_pages:
-                self.log(f"Processing page {current_page}/{total_pages}")
-                
-                # Find all video elements on current page
-                elements = self.driver.find_elements(By.CSS_SELECTOR,
-                    "#app > main > div.space-upload > div.upload-content > div > div.video-body > div > div > div > div > div > div > div.bili-video-card__cover > a > div.bili-cover-card__thumbnail > img")
-                
-                if not elements:
-                    self.log("No matching elements found on this page")
-                    break
-                
-                # Process each element
-                for element in elements:
-                    try:
-                        alt_name = element.get_attribute("alt")
-                        self.log(f"Processing video, alt attribute: {alt_name}")
-
-                        # Get video URL
-                        parent_a = element.find_element(By.XPATH, "./ancestor::a")
-                        video_url = parent_a.get_attribute("href")
-                        self.log(f"Video URL: {video_url}")
-
-                        # Store as dictionary
-                        self.videos.append({
-                            "alt": alt_name,
-                            "url": video_url
-                        })
-
-                    except Exception as e:
-                        self.log(f"Error processing video: {str(e)}")
-                        # Close tab if open and switch back
-                        if len(self.driver.window_handles) > 1:
-                            self.driver.close()
-                            self.driver.switch_to.window(self.driver.window_handles[0])
-                
-                # Save data after each page
-                
-                
-                # Check if we need to go to next page
-                if current_page < total_pages:
-                    try:
-                        # Click next page button
-                        next_page_btn = self.driver.find_element(By.CSS_SELECTOR,
-                            "#app > main > div.space-upload > div.upload-content > div > div.video-footer > div > div.vui_pagenation--btns > button:nth-child(11)")
-                        next_page_btn.click()
-                        self.log("Clicked next page button")
-                        
-                        # Wait for page to load
+            
+            # Check if we need to go to next page
+            if current_page < total_pages:
+                try:
+                    # Click next page button
+                    next_page_btn = self.driver.find_element(By.CSS_SELECTOR,
+                        "#app > main > div.space-upload > div.upload-content > div > div.video-footer > div > div.vui_pagenation--btns > button:nth-child(11)")
+                    # The click loads the next page from the API, pace it like a request
+                    self.limiter.acquire(upload_url)
+                    next_page_btn.click()
+                    self.log("Clicked next page button")
+                    
+                    # Wait for page to load
+                    with metrics.span("upload.sleep"):
                         time.sleep(3)
+                    with metrics.span("upload.wait"):
                         WebDriverWait(self.driver, 10).until(
                             EC.presence_of_element_located((By.CSS_SELECTOR, "#app > main > div.space-upload > div.upload-content"))
                         )
-                        
-                        current_page += 1
-                    except Exception as e:
-                        self.log(f"Failed to go to next page: {str(e)}")
-                        break
-                else:
+                    self.limiter.report(upload_url, throttled=is_captcha_page(self.driver))
+                    
+                    current_page += 1
+                except Exception as e:
+                    self.log(f"Failed to go to next page: {str(e)}")
                     break
+            else:
+                self.listing_complete = True
+                break
 
+    def list_with_api(self, uid, done_pages):
+        """List upload pages from the paged JSON endpoint, return False if it failed
 
-            self.save_data()
-
+        The first response gives the real page count, the remaining pages
+        are fetched concurrently. Incremental syncs fetch one page at a time
+        instead, see api_pages().
+        """
+        try:
+            cookies = self.cookies if self.cookies is not None else self.driver.get_cookies()
+            api = BilibiliApiClient(cookies=cookies, base_url=self.api_base or API_BASE, limiter=self.limiter)
+            for page, vlist, total_pages in self.api_pages(api, uid, done_pages):
+                if page in done_pages:
+                    continue
+                self.log(f"Fetched page {page}/{total_pages} with {len(vlist)} videos")
+                for item in vlist:
+                    video = {
+                        "alt": item.get("title", ""),
+                        "url": bvid_url(item["bvid"], self.video_base),
+                        "bvid": item["bvid"],
+                        "duration": item.get("length", ""),
+                        "published": time.strftime("%Y-%m-%d", time.localtime(item.get("created", 0)))
+                    }
+                    self.add_video(page, video)
+                self.journal.append({"page": page, "done": True})
+            self.listing_complete = True
+            return True
         except Exception as e:
-            self.log(f"Error occurred: {str(e)}")
-        finally:
-            self.quit_browser()
-            self.log("Crawling completed")
+            self.log(f"API listing failed: {str(e)}")
+            return False
+
+    def api_pages(self, api, uid, done_pages, ps=40):
+        """Yield (page, videos, total pages) from the upload list API
+
+        Same page size as the upload page, so journal page numbers mean the
+        same in both modes. Newest uploads come first, so in incremental
+        mode pages are fetched one by one until one contains a known video.
+        A first incremental sync knows no videos yet and fetches them all
+        concurrently like a full listing.
+        """
+        if not self.known:
+            yield from api.iter_upload_pages(uid, ps=ps, skip_pages=done_pages)
+            return
+        page, total_pages = 1, 1
+        while page <= total_pages and not self.reached_known:
+            data = api.get_upload_page(uid, page, ps)
+            total_pages = max(1, math.ceil(((data.get("page") or {}).get("count") or 0) / ps))
+            yield page, ((data.get("list") or {}).get("vlist") or []), total_pages
+            page += 1
+        if self.reached_known:
+            self.log("Reached videos known from the last sync, stopping")
+
+    def list_page(self, page):
+        """Collect the videos of the current page, return False if none were found"""
+        # Read every video card of the page in one script call
+        cards = extract_cards(self.driver)
+
+        if not cards:
+            return False
+
+        # Process each card
+        for card in cards:
+            self.log(f"Processing video, alt attribute: {card['alt']}")
+            self.log(f"Video URL: {card['url']}")
+
+            # Store as dictionary
+            video = {
+                "alt": card["alt"],
+                "url": card["url"],
+                "bvid": card["bvid"],
+                "duration": card["duration"],
+                "published": card["published"]
+            }
+            self.add_video(page, video)
+
+        # Mark the page as complete so --resume can skip it
+        self.journal.append({"page": page, "done": True})
+        return True
+
+    def completed_pages(self):
+        """Return pages marked complete in the journal"""
+        return {entry["page"] for entry in self.journal.records() if entry.get("done")}
+
+    def videos_from_journal(self):
+        """Return journaled videos of complete pages, in page order without duplicates"""
+        records = self.journal.records()
+        done_pages = {entry["page"] for entry in records if entry.get("done")}
+        videos = []
+        seen = set()
+        for entry in sorted(records, key=lambda entry: entry["page"]):
+            video = entry.get("video")
+            if video and entry["page"] in done_pages and video["url"] not in seen:
+                seen.add(video["url"])
+                videos.append(video)
+        return videos
 
     def save_data(self):
         """Save collected video data to file"""
         try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            json_path = os.path.join(self.data_dir, "videos.json")
+            txt_path = os.path.join(self.data_dir, "videos.txt")
+
             # Save as JSON for structured data
-            with open("bilibili/videos.json", "w", encoding="utf-8") as f:
+            with open(json_path, "w", encoding="utf-8") as f:
                 json.dump(self.videos, f, ensure_ascii=False, indent=2)
             
             # Also save as text file for URLs only
-            with open("bilibili/videos.txt", "w", encoding="utf-8") as f:
+            with open(txt_path, "w", encoding="utf-8") as f:
                 for video in self.videos:
                     f.write(f"{video['alt']}\t{video['url']}\n")
             
-            self.log(f"Saved {len(self.videos)} videos to bilibili/videos.json and bilibili/videos.txt")
+            self.log(f"Saved {len(self.videos)} videos to {json_path} and {txt_path}")
+
+            if self.incremental:
+                # Only the videos found by this sync, for the subtitle stage
+                new_path = os.path.join(self.data_dir, "videos_new.json")
+                with open(new_path, "w", encoding="utf-8") as f:
+                    json.dump(self.new_videos, f, ensure_ascii=False, indent=2)
+                self.log(f"Saved {len(self.new_videos)} new videos to {new_path}")
         except Exception as e:
             self.log(f"Failed to save data: {str(e)}")
 
@@ -145,9 +431,38 @@ class BilibiliCrawler:
             self.log("Browser closed")
 
 if __name__ == "__main__":
-    uid = input("Enter UP 主 UID (default: 666759136): ").strip() or "666759136"
-    if not uid.isdigit():
-        print("Error: Please enter a valid UID (digits only)")
+    parser = argparse.ArgumentParser(description="List the uploaded videos of a Bilibili user")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run, skipping pages already listed in the journal")
+    parser.add_argument("--listing", choices=["browser", "api"], default="browser",
+                        help="api reads the paged upload list endpoint instead of clicking through pages")
+    parser.add_argument("--api-base", default=None, help="override the API base URL, e.g. a local stand-in server")
+    parser.add_argument("--incremental", action="store_true",
+                        help="stop at videos known from the last sync and also write only the new ones "
+                             "to videos_new.json")
+    parser.add_argument("--space-base", default=None, help="override the user space base URL")
+    parser.add_argument("--video-base", default=None, help="override the base URL of listed video links")
+    add_browser_arguments(parser)
+    add_rate_arguments(parser)
+    add_metrics_argument(parser)
+    add_uid_arguments(parser)
+    parser.add_argument("--listing-workers", type=int, default=LISTING_WORKERS,
+                        help="UIDs listed at once through the API")
+    args = parser.parse_args()
+    setup_metrics(args)
+
+    uids = uids_from_args(args)
+    invalid = [uid for uid in uids if not uid.isdigit()]
+    if invalid:
+        print(f"Error: Please enter valid UIDs (digits only): {invalid}")
     else:
-        crawler = BilibiliCrawler()
-        crawler.crawl(uid)
\ No newline at end of file
+        options = dict(resume=args.resume, listing=args.listing, api_base=args.api_base,
+                       space_base=args.space_base, video_base=args.video_base, incremental=args.incremental,
+                       limiter=limiter_from_args(args), **browser_options(args))
+        crawler = BilibiliCrawler(**options)
+        if len(uids) == 1:
+            crawler.crawl(uids[0])
+        else:
+            # Each channel keeps its journal and video list in bilibili/<uid>/
+            crawler.crawl_channels({uid: BilibiliCrawler(data_dir=os.path.join("bilibili", uid), **options)
+                                    for uid in uids}, workers=args.listing_workers)
\ No newline at end of file
@@ -1,16 +1,22 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from browser import create_driver, login, block_resources, add_browser_arguments, browser_options, COOKIE_FILE
+from perf_log import PerformanceLogScanner
+from upload_page import extract_cards
+from metrics import metrics, log_summary, add_metrics_argument, setup_metrics
+import argparse
 import time
-import json
 
 class BilibiliCrawler:
-    def __init__(self):
+    def __init__(self, keep_raw_log=0, lean=False, cookie_file=COOKIE_FILE, attach=None):
         self.driver = None
-        self.logs = []
+        # Browser options, see browser.add_browser_arguments
+        self.lean = lean
+        self.cookie_file = cookie_file
+        self.attach = attach
+        # Only the last keep_raw_log raw performance log entries are kept for debugging
+        self.scanner = PerformanceLogScanner(keep_raw=keep_raw_log)
         self.ai_subtitle_urls = []
 
     def log(self, message):
@@ -21,67 +27,66 @@ class BilibiliCrawler:
         """Execute crawling logic"""
         try:
             # Initialize WebDriver
-            options = webdriver.ChromeOptions()
-            options.add_argument("--start-maximized")
-            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
-            self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+            with metrics.span("driver.start"):
+                self.driver = create_driver(lean=self.lean, attach=self.attach)
             self.log("Browser started")
 
-            # 1. Go to Bilibili homepage
-            self.driver.get("https://www.bilibili.com/")
-            self.log("Opened Bilibili homepage, please login...")
+            # 1. Log in, from the saved cookie jar when possible
+            with metrics.span("login"):
+                login(self.driver, self.cookie_file, interactive=not self.lean, log=self.log)
 
-            # 2. Wait for manual login
-            self.log("Please complete login in the browser, then press Enter in the console to continue...")
-            input()
-            self.log("Login detected, continuing...")
-
-            # 3. Go to upload video page
+            # 2. Go to upload video page
             upload_url = f"https://space.bilibili.com/{uid}/upload/video"
-            self.driver.get(upload_url)
+            with metrics.span("upload.open"):
+                self.driver.get(upload_url)
             self.log(f"Navigated to upload video page: {upload_url}")
-            time.sleep(5)
-
-            # 4. Wait for page to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "#app > main > div.space-upload > div.upload-content"))
-            )
+            with metrics.span("upload.sleep"):
+                time.sleep(5)
+
+            # 3. Wait for page to load
+            with metrics.span("upload.wait"):
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "#app > main > div.space-upload > div.upload-content"))
+                )
             self.log("Page loaded, searching for elements...")
 
-            # 5. Find all video elements
-            elements = self.driver.find_elements(By.CSS_SELECTOR,
-                "#app > main > div.space-upload > div.upload-content > div > div.video-body > div > div:nth-child(1) > div > div > div > div > div.bili-video-card__cover > a > div.bili-cover-card__thumbnail > img")
+            # 4. Find all video cards in one script call
+            with metrics.span("upload.extract"):
+                cards = extract_cards(self.driver,
+                    "#app > main > div.space-upload > div.upload-content > div > div.video-body > div > div:nth-child(1) > div > div > div > div > div.bili-video-card__cover > a > div.bili-cover-card__thumbnail > img")
             
-            if not elements:
+            if not cards:
                 self.log("No matching elements found")
                 return
 
-            # 6. Process each element
-            for i, element in enumerate(elements, 1):
+            # 5. Process each card
+            for i, card in enumerate(cards, 1):
                 try:
-                    alt_name = element.get_attribute("alt")
+                    alt_name = card["alt"]
                     self.log(f"Processing video {i}, alt attribute: {alt_name}")
 
-                    # Get video URL
-                    parent_a = element.find_element(By.XPATH, "./ancestor::a")
-                    video_url = parent_a.get_attribute("href")
+                    video_url = card["url"]
                     self.log(f"Video URL: {video_url}")
 
-                    # Open video in new tab
-                    self.driver.execute_script("window.open('');")
-                    self.driver.switch_to.window(self.driver.window_handles[-1])
-                    self.driver.get(video_url)
-                    self.log("Opened video page")
+                    with metrics.span("video", video=video_url):
+                        # Open video in new tab
+                        self.driver.execute_script("window.open('');")
+                        self.driver.switch_to.window(self.driver.window_handles[-1])
+                        if self.lean:
+                            block_resources(self.driver)
+                        with metrics.span("page.get"):
+                            self.driver.get(video_url)
+                        self.log("Opened video page")
 
-                    # Open subtitles
-                    self.open_subtitle()
+                        # Open subtitles
+                        self.open_subtitle()
 
-                    # Search for ai_subtitle
-                    self.search_ai_subtitle()
+                        # Search for ai_subtitle
+                        self.search_ai_subtitle()
 
-                    # Close the current tab and switch back to main tab
-                    self.driver.close()
-                    self.driver.switch_to.window(self.driver.window_handles[0])
+                        # Close the current tab and switch back to main tab
+                        self.driver.close()
+                        self.driver.switch_to.window(self.driver.window_handles[0])
                     self.log("Closed video tab")
 
                 except Exception as e:
@@ -99,6 +104,8 @@ class BilibiliCrawler:
         finally:
             self.quit_browser()
             self.log("Crawling completed")
+            log_summary(self.log)
+            metrics.close()
 
     def open_subtitle(self):
         """Open subtitle for current video"""
@@ -108,17 +115,19 @@ class BilibiliCrawler:
 
         try:
             # Find player div and set data-ctrl-hidden to false
-            player_div = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "#bilibili-player > div > div"))
-            )
+            with metrics.span("subtitle.player_wait"):
+                player_div = WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "#bilibili-player > div > div"))
+                )
             self.driver.execute_script("arguments[0].setAttribute('data-ctrl-hidden', 'false')", player_div)
             self.log("Set data-ctrl-hidden to false")
 
             # Click subtitle button
-            subtitle_button = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR,
-                    "#bilibili-player > div > div > div.bpx-player-primary-area > div.bpx-player-video-area > div.bpx-player-control-wrap > div.bpx-player-control-entity > div.bpx-player-control-bottom > div.bpx-player-control-bottom-right > div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"))
-            )
+            with metrics.span("subtitle.button_wait"):
+                subtitle_button = WebDriverWait(self.driver, 10).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR,
+                        "#bilibili-player > div > div > div.bpx-player-primary-area > div.bpx-player-video-area > div.bpx-player-control-wrap > div.bpx-player-control-entity > div.bpx-player-control-bottom > div.bpx-player-control-bottom-right > div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"))
+                )
             subtitle_button.click()
             self.log("Clicked subtitle button")
         except Exception as e:
@@ -132,15 +141,13 @@ class BilibiliCrawler:
 
         try:
             # Get performance logs
-            logs = self.driver.get_log("performance")
-            self.logs.extend(logs)
-            for entry in logs:
-                log = json.loads(entry["message"])["message"]
-                if "params" in log and "response" in log["params"] and "url" in log["params"]["response"]:
-                    url = log["params"]["response"]["url"]
-                    if "aisubtitle" in url and url not in self.ai_subtitle_urls:
-                        self.ai_subtitle_urls.append(url)
-                        self.log(f"Found ai_subtitle URL: {url}")
+            with metrics.span("log.read"):
+                logs = self.driver.get_log("performance")
+            with metrics.span("log.scan", entries=len(logs)):
+                urls = self.scanner.scan(logs)
+            for url in urls:
+                self.ai_subtitle_urls.append(url)
+                self.log(f"Found ai_subtitle URL: {url}")
         except Exception as e:
             self.log(f"Failed to capture ai_subtitle request: {str(e)}")
 
@@ -162,9 +169,15 @@ class BilibiliCrawler:
             self.log("Browser closed")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect AI subtitle URLs of the videos on a user's upload page")
+    add_browser_arguments(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+    setup_metrics(args)
+
     uid = input("Enter UP 主 UID (default: 666759136): ").strip() or "666759136"
     if not uid.isdigit():
         print("Error: Please enter a valid UID (digits only)")
     else:
-        crawler = BilibiliCrawler()
+        crawler = BilibiliCrawler(**browser_options(args))
         crawler.crawl(uid)
\ No newline at end of file
@@ -1,17 +1,52 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from browser import (create_driver, load_cookies, login, block_resources, open_page, add_browser_arguments,
+                     browser_options, COOKIE_FILE)
+from bili_api import BilibiliApiClient, API_BASE, extract_bvid, ai_subtitle_urls
+from perf_log import PerformanceLogScanner
+from crawl_journal import CrawlJournal
+from subtitle_cache import SubtitleCache, url_key
+from rate_limit import AdaptiveRateLimiter, add_rate_arguments, limiter_from_args
+from metrics import metrics, log_summary, add_metrics_argument, setup_metrics
+import argparse
+import threading
+import queue
+import base64
 import time
 import json
 
+# Player API responses that carry the subtitle list of the current part
+PLAYER_API_PATHS = ("/x/player/wbi/v2", "/x/player/v2")
+
 class BilibiliSubtitleCrawler:
-    def __init__(self):
+    def __init__(self, workers=1, resolver="browser", api_base=None, capture_timeout=10, keep_raw_log=0,
+                 resume=False, journal_path="bilibili/videos_with_ai_subtitle.journal.jsonl",
+                 cache_path="bilibili/subtitle_cache.sqlite3", lean=False, cookie_file=COOKIE_FILE,
+                 attach=None, limiter=None):
         self.driver = None
-        self.logs = []
+        # Only the last keep_raw_log raw performance log entries are kept for debugging
+        self.keep_raw_log = keep_raw_log
+        self.scanner = PerformanceLogScanner(keep_raw=keep_raw_log, watch=PLAYER_API_PATHS)
         self.videos_with_subtitles = []
+        self.workers = max(1, workers)
+        self.resolver = resolver  # "browser" or "http"
+        self.api_base = api_base
+        self.api = None
+        self.capture_timeout = capture_timeout
+        # Every processed video is appended to the journal, --resume skips the finished ones
+        self.resume = resume
+        self.journal_path = journal_path
+        self.journal = None
+        # Resolved subtitle URLs are cached by BV id, a cache hit skips the browser
+        self.cache_path = cache_path
+        self.cache = None
+        # Browser options, see browser.add_browser_arguments
+        self.lean = lean
+        self.cookie_file = cookie_file
+        self.attach = attach
+        # Shared by all workers
+        self.limiter = limiter or AdaptiveRateLimiter()
 
     def log(self, message):
         """Print log message to console"""
@@ -21,22 +56,15 @@ class BilibiliSubtitleCrawler:
         """Execute crawling logic"""
         try:
             # Initialize WebDriver
-            options = webdriver.ChromeOptions()
-            options.add_argument("--start-maximized")
-            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
-            self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+            with metrics.span("driver.start"):
+                self.driver = create_driver(lean=self.lean, attach=self.attach)
             self.log("Browser started")
 
-            # 1. Go to Bilibili homepage
-            self.driver.get("https://www.bilibili.com/")
-            self.log("Opened Bilibili homepage, please login...")
-
-            # 2. Wait for manual login
-            self.log("Please complete login in the browser, then press Enter in the console to continue...")
-            input()
-            self.log("Login detected, continuing...")
+            # 1. Log in, from the saved cookie jar when possible
+            with metrics.span("login"):
+                login(self.driver, self.cookie_file, interactive=not self.lean, log=self.log)
 
-            # 3. Load videos from JSON file
+            # 2. Load videos from JSON file
             try:
                 with open("bilibili/videos1.json", "r", encoding="utf-8") as f:
                     videos = json.load(f)
@@ -45,63 +73,292 @@ class BilibiliSubtitleCrawler:
                 self.log(f"Failed to load videos.json: {str(e)}")
                 return
 
-            # 4. Process each video
-            for video in videos:
-                try:
-                    alt = video.get("alt", "")
-                    url = video.get("url", "")
-                    
-                    if not url:
-                        self.log(f"Skipping video with empty URL: {alt}")
-                        continue
-                        
-                    self.log(f"Processing video: {alt}")
-                    self.log(f"Video URL: {url}")
-
-                    # Open video in new tab
-                    self.driver.execute_script("window.open('');")
-                    self.driver.switch_to.window(self.driver.window_handles[-1])
-                    self.driver.get(url)
-                    self.log("Opened video page")
-
-                    # Open subtitles
-                    self.open_subtitle()
-                    
-                    # Wait for 2 seconds
-                    time.sleep(2)
-
-                    # Search for ai_subtitle
-                    ai_subtitle_urls = self.search_ai_subtitle()
-                    
-                    # Save video info with subtitle URLs
-                    video_data = {
-                        "alt": alt,
-                        "url": url,
-                        "ai_subtitle_urls": ai_subtitle_urls
-                    }
-                    self.videos_with_subtitles.append(video_data)
-                    self.log(f"Found {len(ai_subtitle_urls)} AI subtitle URLs for this video")
-
-                    # Close the current tab and switch back to main tab
-                    self.driver.close()
-                    self.driver.switch_to.window(self.driver.window_handles[0])
-                    self.log("Closed video tab")
+            # 3. Skip videos finished by an interrupted run
+            completed = self.prepare()
+            pending = [video for video in videos if video.get("url") not in completed]
+            if self.resume:
+                self.log(f"Resuming: {len(videos) - len(pending)} videos already done, {len(pending)} left")
 
-                except Exception as e:
-                    self.log(f"Error processing video {alt}: {str(e)}")
-                    # Close tab if open and switch back
-                    if len(self.driver.window_handles) > 1:
-                        self.driver.close()
-                        self.driver.switch_to.window(self.driver.window_handles[0])
+            # 4. Process each video
+            if self.workers == 1:
+                for video in pending:
+                    with metrics.span("video", video=video.get("url")):
+                        self.process_video(video)
+            else:
+                tasks = queue.Queue()
+                for index, video in enumerate(pending):
+                    tasks.put((index, video))
+                for _ in range(self.workers):
+                    tasks.put(None)
+                self.run_workers(tasks)
 
             # Save results to JSON file
-            self.save_results()
+            self.finish(videos)
 
         except Exception as e:
             self.log(f"Error occurred: {str(e)}")
         finally:
+            self.close()
             self.quit_browser()
             self.log("Crawling completed")
+            log_summary(self.log)
+            metrics.close()
+
+    def prepare(self):
+        """Set up the HTTP resolver, cache and journal after login, return URLs already done"""
+        # Reuse the logged-in session for direct API calls, the browser resolver uses them for the other parts
+        self.api = BilibiliApiClient(cookies=self.driver.get_cookies(),
+                                     base_url=self.api_base or API_BASE, limiter=self.limiter)
+        if self.resolver == "http":
+            self.log("Resolving subtitles over HTTP, browser is only used as fallback")
+
+        if self.cache_path:
+            self.cache = SubtitleCache(self.cache_path)
+
+        self.journal = CrawlJournal(self.journal_path)
+        completed = self.completed_urls() if self.resume else set()
+        self.journal.open(fresh=not self.resume)
+        return completed
+
+    def finish(self, videos):
+        """Build results from the journal and save them
+
+        Videos of earlier runs are included, in the same order as videos.
+        """
+        self.journal.close()
+        self.videos_with_subtitles = self.results_from_journal(videos)
+        self.save_results()
+
+    def close(self):
+        """Close the journal and cache"""
+        if self.journal:
+            self.journal.close()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
+    def process_video(self, video):
+        """Capture the subtitle URLs of all parts of one video, return None if it was skipped"""
+        alt = video.get("alt", "")
+        try:
+            url = video.get("url", "")
+
+            if not url:
+                self.log(f"Skipping video with empty URL: {alt}")
+                return None
+
+            self.log(f"Processing video: {alt}")
+            self.log(f"Video URL: {url}")
+
+            bvid = None
+            parts = None
+            if self.cache is not None:
+                try:
+                    bvid = extract_bvid(url)
+                    with metrics.span("cache.lookup"):
+                        parts = self.cache.get(bvid)
+                except Exception as e:
+                    self.log(f"Subtitle cache lookup failed: {str(e)}")
+                if parts is not None:
+                    self.log("Subtitle cache hit")
+            cached = parts is not None
+            if parts is None and self.resolver == "http":
+                parts = self.resolve_with_api(url)
+            status = None
+            if parts is None:
+                captured_urls, status = self.capture_with_browser(url)
+                parts = self.complete_parts(url, captured_urls, status)
+            urls = ai_subtitle_urls(parts)
+            # A subtitle the browser captured is found, whatever the HTTP pass says
+            if status not in ("found", "timeout"):
+                status = "found" if urls else "no_subtitle"
+
+            if bvid and not cached and status != "timeout":
+                try:
+                    self.cache.put(bvid, parts)
+                except Exception as e:
+                    self.log(f"Failed to update subtitle cache: {str(e)}")
+
+            # Save video info with the subtitles of every part, plus all AI subtitle URLs
+            video_data = {
+                "alt": alt,
+                "url": url,
+                "parts": parts,
+                "ai_subtitle_urls": urls,
+                "subtitle_status": status
+            }
+            if status == "timeout":
+                self.log(f"Timed out after {self.capture_timeout}s waiting for AI subtitle")
+            elif status == "no_subtitle":
+                self.log("Video has no AI subtitle")
+            else:
+                self.log(f"Found {len(urls)} AI subtitle URLs in {len(parts)} parts of this video")
+            # Timeouts are kept in the results but retried on --resume
+            self.record("failed" if status == "timeout" else "done", url, video=video_data)
+            return video_data
+
+        except Exception as e:
+            self.log(f"Error processing video {alt}: {str(e)}")
+            self.record("failed", video.get("url", ""), error=str(e))
+            # Close tab if open and switch back
+            if len(self.driver.window_handles) > 1:
+                self.driver.close()
+                self.driver.switch_to.window(self.driver.window_handles[0])
+            return None
+
+    def record(self, status, url, video=None, error=None):
+        """Append the outcome of one video to the journal"""
+        if self.journal is None:
+            return
+        entry = {"url": url, "status": status, "time": time.time()}
+        if video is not None:
+            entry["video"] = video
+        if error is not None:
+            entry["error"] = error
+        try:
+            self.journal.append(entry)
+        except Exception as e:
+            self.log(f"Failed to write journal: {str(e)}")
+
+    def completed_urls(self):
+        """Return URLs whose latest journal record is done"""
+        latest = {}
+        for entry in self.journal.records():
+            latest[entry.get("url")] = entry.get("status")
+        return {url for url, status in latest.items() if status == "done"}
+
+    def results_from_journal(self, videos):
+        """Return the latest journaled result of each video, in input order"""
+        latest = {}
+        for entry in self.journal.records():
+            if "video" in entry:
+                latest[entry.get("url")] = entry["video"]
+        return [latest[video["url"]] for video in videos if video.get("url") in latest]
+
+    def resolve_with_api(self, url):
+        """Resolve the subtitles of all parts over HTTP, return None if the browser is needed"""
+        try:
+            with metrics.span("resolve.http"):
+                parts = self.api.get_subtitle_parts(url)
+            self.log("Resolved subtitles over HTTP")
+            return parts
+        except Exception as e:
+            self.log(f"HTTP resolver failed, falling back to browser: {str(e)}")
+            return None
+
+    def complete_parts(self, url, captured_urls, status):
+        """Return the parts of a video whose first part was captured in the browser
+
+        The page only loads the subtitle of its first part, so the other
+        parts and languages are resolved in one batched pass over HTTP
+        instead of loading a page per part. The captured URLs are kept in
+        the first part, with the language the HTTP pass lists for them.
+        """
+        parts = None
+        if status != "timeout" and self.api is not None:
+            try:
+                with metrics.span("resolve.parts"):
+                    parts = self.api.get_subtitle_parts(url)
+            except Exception as e:
+                self.log(f"Failed to resolve the other parts over HTTP: {str(e)}")
+        if not parts:
+            parts = [{"cid": None, "page": 1, "part": "", "subtitles": []}]
+        # The HTTP pass signs its URLs again, match them to the captured ones without the signature
+        listed = {url_key(subtitle["url"]): subtitle for subtitle in parts[0]["subtitles"]}
+        captured = [dict(listed.pop(url_key(captured_url), {"lan": "", "lan_doc": ""}), url=captured_url)
+                    for captured_url in captured_urls]
+        parts[0]["subtitles"] = captured + list(listed.values())
+        return parts
+
+    def capture_with_browser(self, url):
+        """Load the video page and capture AI subtitle URLs from the network log"""
+        # Drop events left over from earlier pages so they are not attributed to this video
+        with metrics.span("log.drain"):
+            self.driver.get_log("performance")
+
+        # Open video in new tab
+        with metrics.span("tab.open"):
+            self.driver.execute_script("window.open('');")
+            self.driver.switch_to.window(self.driver.window_handles[-1])
+            if self.lean:
+                block_resources(self.driver)
+        with metrics.span("page.get"):
+            open_page(self.driver, url, self.limiter)
+        self.log("Opened video page")
+
+        # Open subtitles
+        self.open_subtitle()
+
+        # Wait for the ai_subtitle response
+        with metrics.span("subtitle.wait"):
+            ai_subtitle_urls, status = self.wait_for_ai_subtitle()
+
+        # Close the current tab and switch back to main tab
+        with metrics.span("tab.close"):
+            self.driver.close()
+            self.driver.switch_to.window(self.driver.window_handles[0])
+        self.log("Closed video tab")
+        return ai_subtitle_urls, status
+
+    def run_workers(self, tasks, on_result=None, share_driver=True, cookies=None):
+        """Process (index, video) items from a queue with a pool of browser workers
+
+        Each worker consumes items until it reads a None sentinel, so the
+        producer must put one None per worker after the last video.
+        With share_driver, worker 0 reuses the logged-in driver; the other
+        workers start their own browser and copy its session cookies (pass
+        cookies when another thread keeps using the logged-in driver).
+        """
+        if cookies is None:
+            cookies = self.driver.get_cookies()
+        threads = []
+        for worker_id in range(self.workers):
+            thread = threading.Thread(target=self.worker_loop,
+                                      args=(worker_id, cookies, tasks, on_result, share_driver),
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def worker_loop(self, worker_id, cookies, tasks, on_result, share_driver=True):
+        """Run one browser worker until its sentinel is reached"""
+        worker = BilibiliSubtitleCrawler(resolver=self.resolver, capture_timeout=self.capture_timeout,
+                                         keep_raw_log=self.keep_raw_log, lean=self.lean, limiter=self.limiter)
+        worker.api = self.api
+        worker.journal = self.journal
+        worker.cache = self.cache
+        worker.log = lambda message: self.log(f"[worker {worker_id}] {message}")
+        try:
+            if worker_id == 0 and share_driver:
+                worker.driver = self.driver
+            else:
+                with metrics.span("driver.start", worker=worker_id):
+                    worker.driver = create_driver(lean=self.lean)
+                load_cookies(worker.driver, cookies)
+            worker.log("Browser ready")
+        except Exception as e:
+            # Leave the remaining videos to the other workers
+            worker.log(f"Failed to start browser: {str(e)}")
+            if worker.driver is not self.driver:
+                worker.quit_browser()
+            return
+
+        try:
+            while True:
+                item = tasks.get()
+                if item is None:
+                    break
+                index, video = item
+                with metrics.span("video", video=video.get("url"), worker=worker_id):
+                    video_data = worker.process_video(video)
+                if video_data is not None and on_result is not None:
+                    on_result(index, video_data)
+        except Exception as e:
+            worker.log(f"Worker stopped: {str(e)}")
+        finally:
+            if worker.driver is not self.driver:
+                worker.quit_browser()
 
     def open_subtitle(self):
         """Open subtitle for current video"""
@@ -111,48 +368,102 @@ class BilibiliSubtitleCrawler:
 
         try:
             # Find player div and set data-ctrl-hidden to false
-            player_div = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "#bilibili-player > div > div"))
-            )
+            with metrics.span("subtitle.player_wait"):
+                player_div = WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "#bilibili-player > div > div"))
+                )
             self.driver.execute_script("arguments[0].setAttribute('data-ctrl-hidden', 'false')", player_div)
             self.log("Set data-ctrl-hidden to false")
 
             # Click subtitle button
-            subtitle_button = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR,
-                    "#bilibili-player > div > div > div.bpx-player-primary-area > div.bpx-player-video-area > div.bpx-player-control-wrap > div.bpx-player-control-entity > div.bpx-player-control-bottom > div.bpx-player-control-bottom-right > div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"))
-            )
+            with metrics.span("subtitle.button_wait"):
+                subtitle_button = WebDriverWait(self.driver, 10).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR,
+                        "#bilibili-player > div > div > div.bpx-player-primary-area > div.bpx-player-video-area > div.bpx-player-control-wrap > div.bpx-player-control-entity > div.bpx-player-control-bottom > div.bpx-player-control-bottom-right > div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"))
+                )
             subtitle_button.click()
             self.log("Clicked subtitle button")
         except Exception as e:
             self.log(f"Failed to open subtitle: {str(e)}")
 
-    def search_ai_subtitle(self):
-        """Search for ai_subtitle network requests and return found URLs"""
+    def wait_for_ai_subtitle(self):
+        """Consume DevTools network events until the AI subtitle response arrives
+
+        Returns (ai_subtitle_urls, status). status is "found" as soon as an
+        aisubtitle response is seen, "no_subtitle" when the player API
+        reported no AI subtitle for the video, and "timeout" when neither
+        happened within capture_timeout seconds.
+        """
         ai_subtitle_urls = []
-        
+
         if not self.driver:
             self.log("Browser not running")
-            return ai_subtitle_urls
+            return ai_subtitle_urls, "timeout"
 
+        self.scanner.reset()
+        player_requests = []
+        deadline = time.monotonic() + self.capture_timeout
+        # Read and scan time summed over all polls, recorded once per video
+        timing = {"log.read": 0.0, "log.scan": 0.0}
         try:
-            # Get performance logs
-            logs = self.driver.get_log("performance")
-            self.logs.extend(logs)
-            for entry in logs:
+            return self.poll_ai_subtitle(ai_subtitle_urls, player_requests, deadline, timing)
+        finally:
+            for stage, duration in timing.items():
+                metrics.record(stage, duration)
+
+    def poll_ai_subtitle(self, ai_subtitle_urls, player_requests, deadline, timing):
+        """Poll the performance log for wait_for_ai_subtitle until a result or the deadline"""
+        while True:
+            try:
+                # chromedriver buffers Network.* events here, each call returns the new ones
+                start = time.perf_counter()
+                logs = self.driver.get_log("performance")
+                timing["log.read"] += time.perf_counter() - start
+            except Exception as e:
+                self.log(f"Failed to capture ai_subtitle request: {str(e)}")
+                return ai_subtitle_urls, "timeout"
+
+            start = time.perf_counter()
+            urls = self.scanner.scan(logs)
+            timing["log.scan"] += time.perf_counter() - start
+            for url in urls:
+                ai_subtitle_urls.append(url)
+                self.log(f"Found ai_subtitle URL: {url}")
+            player_requests.extend(request_id for request_id, _ in self.scanner.pop_watched())
+
+            if ai_subtitle_urls:
+                return ai_subtitle_urls, "found"
+
+            for request_id in list(player_requests):
+                body = self.get_response_body(request_id)
+                if body is None:
+                    # Body not finished loading yet, try again on the next round
+                    continue
+                player_requests.remove(request_id)
                 try:
-                    log = json.loads(entry["message"])["message"]
-                    if "params" in log and "response" in log["params"] and "url" in log["params"]["response"]:
-                        url = log["params"]["response"]["url"]
-                        if "aisubtitle" in url.lower() and url not in ai_subtitle_urls:
-                            ai_subtitle_urls.append(url)
-                            self.log(f"Found ai_subtitle URL: {url}")
-                except:
+                    data = json.loads(body).get("data") or {}
+                    subtitles = (data.get("subtitle") or {}).get("subtitles") or []
+                except Exception:
+                    # Unreadable response, let the deadline decide
                     continue
-        except Exception as e:
-            self.log(f"Failed to capture ai_subtitle request: {str(e)}")
-            
-        return ai_subtitle_urls
+                if not any(s.get("lan", "").startswith("ai-") or "aisubtitle" in s.get("subtitle_url", "")
+                           for s in subtitles):
+                    return ai_subtitle_urls, "no_subtitle"
+
+            if time.monotonic() >= deadline:
+                return ai_subtitle_urls, "timeout"
+            time.sleep(0.1)
+
+    def get_response_body(self, request_id):
+        """Return the body of a captured response, None if it is not available yet"""
+        try:
+            result = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception:
+            return None
+        body = result.get("body", "")
+        if result.get("base64Encoded"):
+            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        return body
 
     def save_results(self):
         """Save collected video data with subtitles to JSON file"""
@@ -171,5 +482,25 @@ class BilibiliSubtitleCrawler:
             self.log("Browser closed")
 
 if __name__ == "__main__":
-    crawler = BilibiliSubtitleCrawler()
+    parser = argparse.ArgumentParser(description="Collect AI subtitle URLs for videos in bilibili/videos1.json")
+    parser.add_argument("--workers", type=int, default=1, help="number of parallel browser workers")
+    parser.add_argument("--resolver", choices=["browser", "http"], default="browser",
+                        help="http calls the view/player API first and only loads the page on failure")
+    parser.add_argument("--api-base", default=None, help="override the API base URL, e.g. a local stand-in server")
+    parser.add_argument("--capture-timeout", type=float, default=10,
+                        help="seconds to wait for the subtitle response after clicking the subtitle button")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run, skipping videos already done in the journal")
+    parser.add_argument("--cache", default="bilibili/subtitle_cache.sqlite3",
+                        help="subtitle URL cache database, pass an empty string to disable")
+    add_browser_arguments(parser)
+    add_rate_arguments(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+    setup_metrics(args)
+
+    crawler = BilibiliSubtitleCrawler(workers=args.workers, resolver=args.resolver, api_base=args.api_base,
+                                      capture_timeout=args.capture_timeout, resume=args.resume,
+                                      cache_path=args.cache, limiter=limiter_from_args(args),
+                                      **browser_options(args))
     crawler.crawl()
\ No newline at end of file
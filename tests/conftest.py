@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_bilibili import MockBilibiliServer
+
+
+@pytest.fixture
+def start_mock():
+    """Return a function that starts a MockBilibiliServer on a free port, stopped after the test"""
+    servers = []
+
+    def start(**options):
+        server = MockBilibiliServer(port=0, **options)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,130 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+import pytest
+
+from bili_api import BilibiliApiClient, BilibiliApiError, ai_subtitle_urls
+from rate_limit import AdaptiveRateLimiter
+
+# Mixin key of the img_key/sub_key pair the mock's nav answers with, as published for the live site
+KNOWN_MIXIN_KEY = "ea1db124af3c7062474693fa704f4ff8"
+
+
+def quiet_limiter():
+    """A limiter with short pauses that does not print"""
+    limiter = AdaptiveRateLimiter(rate=100.0, max_rate=100.0, cooldown=0.01, max_cooldown=0.05)
+    limiter.log = lambda message: None
+    return limiter
+
+
+def test_subtitle_parts_lists_every_part_and_language(start_mock):
+    mock = start_mock(videos=30, subtitle_rate=1.0, max_parts=3, languages=["ai-zh", "ai-en"])
+    bvid = next(video["bvid"] for video in mock.catalog("42") if mock.parts(video["bvid"]) == 3)
+    client = BilibiliApiClient(base_url=mock.base_url)
+
+    parts = client.get_subtitle_parts(f"{mock.base_url}/video/{bvid}/")
+
+    assert [part["page"] for part in parts] == [1, 2, 3]
+    assert len({part["cid"] for part in parts}) == 3
+    for part in parts:
+        assert [subtitle["lan"] for subtitle in part["subtitles"]] == ["ai-zh", "ai-en"]
+        assert all(subtitle["lan_doc"] and subtitle["url"] for subtitle in part["subtitles"])
+    assert len(ai_subtitle_urls(parts)) == 6
+    # One view request, then one player request per part
+    assert mock.stats()["requests"] == {"/x/web-interface/view": 1, "/x/player/v2": 3}
+
+
+def test_subtitle_parts_without_subtitles(start_mock):
+    mock = start_mock(videos=5, subtitle_rate=0.0)
+    bvid = mock.catalog("42")[0]["bvid"]
+    parts = BilibiliApiClient(base_url=mock.base_url).get_subtitle_parts(bvid)
+    assert len(parts) == 1
+    assert parts[0]["subtitles"] == []
+    assert ai_subtitle_urls(parts) == []
+
+
+def test_subtitle_parts_missing_cid(start_mock):
+    mock = start_mock(videos=5)
+    bvid = mock.catalog("42")[0]["bvid"]
+    mock.view = lambda bvid: {"code": 0, "message": "0", "data": {"bvid": bvid, "title": "no cid"}}
+    with pytest.raises(BilibiliApiError, match="No cid"):
+        BilibiliApiClient(base_url=mock.base_url).get_subtitle_parts(bvid)
+
+
+def test_iter_upload_pages_fetches_every_page(start_mock):
+    mock = start_mock(videos=95)
+    client = BilibiliApiClient(base_url=mock.base_url)
+
+    pages = {page: (vlist, total) for page, vlist, total in client.iter_upload_pages("42", ps=30, workers=3)}
+
+    assert sorted(pages) == [1, 2, 3, 4]
+    assert {total for _, total in pages.values()} == {4}
+    bvids = [video["bvid"] for page in sorted(pages) for video in pages[page][0]]
+    assert bvids == [video["bvid"] for video in mock.catalog("42")]
+
+
+def test_iter_upload_pages_skips_pages(start_mock):
+    mock = start_mock(videos=95)
+    client = BilibiliApiClient(base_url=mock.base_url)
+    pages = [page for page, _, _ in client.iter_upload_pages("42", ps=30, skip_pages={2, 3})]
+    assert sorted(pages) == [1, 4]
+    assert mock.stats()["requests"]["/x/space/wbi/arc/search"] == 2
+
+
+def test_upload_page_request_is_wbi_signed(start_mock):
+    mock = start_mock(videos=10)
+    client = BilibiliApiClient(base_url=mock.base_url)
+    client.get_upload_page("42", 1, ps=30)
+
+    assert client.get_mixin_key() == KNOWN_MIXIN_KEY
+    query = dict(mock.last_query["/x/space/wbi/arc/search"])
+    assert query["mid"] == "42" and query["pn"] == "1" and query["ps"] == "30"
+    assert "dm_img_str" in query and "wts" in query
+    w_rid = query.pop("w_rid")
+    assert w_rid == md5((urlencode(sorted(query.items())) + KNOWN_MIXIN_KEY).encode()).hexdigest()
+
+
+def test_throttled_request_is_retried(start_mock):
+    mock = start_mock(videos=5, error_status=412)
+    failures = iter([True])
+    mock.should_fail = lambda: next(failures, False)
+    limiter = quiet_limiter()
+    client = BilibiliApiClient(base_url=mock.base_url, limiter=limiter, throttle_retries=2)
+
+    assert client.get_video_info(mock.catalog("42")[0]["bvid"])["cid"]
+    assert mock.stats()["requests"]["/x/web-interface/view"] == 2
+    # The 412 halved the rate, the successful retry raised it again by the increase
+    assert limiter.rate(mock.base_url) == pytest.approx(100.0 * 0.5 + 0.1)
+
+
+def test_throttled_request_gives_up_after_retries(start_mock):
+    mock = start_mock(videos=5, error_rate=1.0, error_status=412)
+    client = BilibiliApiClient(base_url=mock.base_url, limiter=quiet_limiter(), throttle_retries=2)
+    with pytest.raises(BilibiliApiError, match="throttled with HTTP 412"):
+        client.get_video_info(mock.catalog("42")[0]["bvid"])
+    assert mock.stats()["errors"] == 3
+
+
+def test_throttled_request_without_limiter_fails_at_once(start_mock):
+    mock = start_mock(videos=5, error_rate=1.0, error_status=412)
+    with pytest.raises(BilibiliApiError):
+        BilibiliApiClient(base_url=mock.base_url).get_video_info(mock.catalog("42")[0]["bvid"])
+    assert mock.stats()["errors"] == 1
+
+
+def test_connection_error_counts_as_throttled():
+    limiter = quiet_limiter()
+    # Nothing listens on port 1, the connection is refused at once
+    client = BilibiliApiClient(base_url="http://127.0.0.1:1", limiter=limiter)
+    with pytest.raises(BilibiliApiError, match="failed"):
+        client.get_video_info("BV1xx411c7mD")
+    assert limiter.rate("http://127.0.0.1:1") == pytest.approx(50.0)
+
+
+def test_server_error_leaves_the_rate(start_mock):
+    mock = start_mock(videos=5, error_rate=1.0, error_status=500)
+    limiter = quiet_limiter()
+    limiter.report(mock.base_url, throttled=True)
+    with pytest.raises(BilibiliApiError):
+        BilibiliApiClient(base_url=mock.base_url, limiter=limiter).get_video_info(mock.catalog("42")[0]["bvid"])
+    assert limiter.rate(mock.base_url) == pytest.approx(50.0)
@@ -0,0 +1,38 @@
+from browser import open_page
+from rate_limit import AdaptiveRateLimiter
+
+
+class PageDriver:
+    """Stands in for a driver whose pages show a captcha when captcha is set"""
+
+    def __init__(self, captcha=False):
+        self.captcha = captcha
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def execute_script(self, script):
+        return self.captcha
+
+
+def limiter():
+    """A limiter that judges every response slow and does not print"""
+    rate_limiter = AdaptiveRateLimiter(rate=100.0, max_rate=200.0, slow_latency=0.0, cooldown=0.01)
+    rate_limiter.log = lambda message: None
+    return rate_limiter
+
+
+def test_slow_page_loads_do_not_lower_the_rate():
+    rate_limiter = limiter()
+    driver = PageDriver()
+    for _ in range(5):
+        open_page(driver, "https://www.bilibili.com/video/BV1xx411c7mD/", rate_limiter)
+    assert len(driver.urls) == 5
+    assert rate_limiter.rate("https://www.bilibili.com/") > 100.0
+
+
+def test_captcha_page_lowers_the_rate():
+    rate_limiter = limiter()
+    open_page(PageDriver(captcha=True), "https://www.bilibili.com/video/BV1xx411c7mD/", rate_limiter)
+    assert rate_limiter.rate("https://www.bilibili.com/") == 50.0
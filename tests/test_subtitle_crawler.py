@@ -0,0 +1,90 @@
+import queue
+
+import pytest
+
+import test6
+from bili_api import BilibiliApiClient
+from test6 import BilibiliSubtitleCrawler
+
+
+def crawler(mock):
+    """A crawler resolving the other parts against mock, without browser, cache or journal"""
+    subtitle_crawler = BilibiliSubtitleCrawler(cache_path=None)
+    subtitle_crawler.api = BilibiliApiClient(base_url=mock.base_url)
+    subtitle_crawler.log = lambda message: None
+    subtitle_crawler.record = lambda *args, **kwargs: None
+    return subtitle_crawler
+
+
+def video_with_parts(mock, count):
+    """Return the BV id and page URL of a mock video with count parts"""
+    bvid = next(video["bvid"] for video in mock.catalog("42") if mock.parts(video["bvid"]) == count)
+    return bvid, f"{mock.base_url}/video/{bvid}/"
+
+
+def test_captured_urls_stay_in_the_first_part(start_mock):
+    mock = start_mock(videos=30, subtitle_rate=1.0, max_parts=2, languages=["ai-zh", "ai-en"])
+    bvid, url = video_with_parts(mock, 2)
+    captured_url = f"{mock.base_url}/aisubtitle/{bvid}_1_ai-zh.json?auth_key=captured"
+
+    parts = crawler(mock).complete_parts(url, [captured_url], "found")
+
+    assert [part["page"] for part in parts] == [1, 2]
+    first = parts[0]["subtitles"]
+    assert [subtitle["lan"] for subtitle in first] == ["ai-zh", "ai-en"]
+    assert first[0]["url"] == captured_url
+    assert [subtitle["lan"] for subtitle in parts[1]["subtitles"]] == ["ai-zh", "ai-en"]
+
+
+def test_captured_urls_missing_from_the_api(start_mock):
+    mock = start_mock(videos=5, subtitle_rate=0.0)
+    bvid, url = video_with_parts(mock, 1)
+    captured_url = f"{mock.base_url}/aisubtitle/{bvid}_1_ai-zh.json?auth_key=captured"
+    subtitle_crawler = crawler(mock)
+    subtitle_crawler.capture_with_browser = lambda page_url: ([captured_url], "found")
+
+    video = subtitle_crawler.process_video({"alt": "video", "url": url})
+
+    assert video["subtitle_status"] == "found"
+    assert video["ai_subtitle_urls"] == [captured_url]
+    assert video["parts"][0]["subtitles"] == [{"lan": "", "lan_doc": "", "url": captured_url}]
+
+
+def test_captured_urls_without_the_api():
+    subtitle_crawler = BilibiliSubtitleCrawler(cache_path=None)
+    parts = subtitle_crawler.complete_parts("https://www.bilibili.com/video/BV1xx411c7mD/", ["https://a/1"], "found")
+    assert parts == [{"cid": None, "page": 1, "part": "", "subtitles": [{"lan": "", "lan_doc": "", "url": "https://a/1"}]}]
+
+
+class StubDriver:
+    """Stands in for the browsers of the worker pool, which the HTTP resolver must not need"""
+
+    def get_cookies(self):
+        return []
+
+    def quit(self):
+        pass
+
+
+def test_worker_pool_resolves_over_http(start_mock, monkeypatch):
+    mock = start_mock(videos=6, subtitle_rate=1.0)
+    monkeypatch.setattr(test6, "create_driver", lambda **options: StubDriver())
+    monkeypatch.setattr(test6, "load_cookies", lambda driver, cookies: None)
+    monkeypatch.setattr(BilibiliSubtitleCrawler, "capture_with_browser",
+                        lambda self, url: pytest.fail("the browser was used with resolver=http"))
+    subtitle_crawler = BilibiliSubtitleCrawler(workers=2, resolver="http", cache_path=None)
+    subtitle_crawler.api = BilibiliApiClient(base_url=mock.base_url)
+    subtitle_crawler.driver = StubDriver()
+    subtitle_crawler.log = lambda message: None
+    tasks = queue.Queue()
+    for index, video in enumerate(mock.catalog("42")):
+        tasks.put((index, {"alt": video["title"], "url": f"{mock.base_url}/video/{video['bvid']}/"}))
+    for _ in range(subtitle_crawler.workers):
+        tasks.put(None)
+    results = {}
+
+    subtitle_crawler.run_workers(tasks, on_result=results.__setitem__)
+
+    assert sorted(results) == list(range(6))
+    assert all(video["subtitle_status"] == "found" for video in results.values())
+    assert mock.stats()["requests"]["/x/web-interface/view"] == 6
@@ -0,0 +1,109 @@
+import json
+import os
+
+from subtitle_cache import SubtitleCache
+from subtitle_download import SubtitleDownloader, format_timestamp, to_srt, to_text, to_vtt
+
+CUES = [{"from": 0.0, "to": 2.5, "content": "第一句"}, {"from": 3661.5, "to": 3663.25, "content": "second"}]
+
+
+def subtitle_url(mock, page=1, lan="ai-zh"):
+    """Return the URL of a subtitle the mock serves"""
+    return f"{mock.base_url}/aisubtitle/{mock.catalog('42')[0]['bvid']}_{page}_{lan}.json"
+
+
+def downloader(tmp_path, **options):
+    """A downloader with near-zero backoff that does not print"""
+    options.setdefault("backoff", 0.001)
+    subtitle_downloader = SubtitleDownloader(output_dir=str(tmp_path / "subtitles"), **options)
+    subtitle_downloader.log = lambda message: None
+    return subtitle_downloader
+
+
+def fail_first(mock, count):
+    """Make the first count subtitle responses of mock injected errors"""
+    failures = iter([True] * count)
+    mock.should_fail = lambda: next(failures, False)
+
+
+def test_format_timestamp():
+    assert format_timestamp(0) == "00:00:00,000"
+    assert format_timestamp(3661.5) == "01:01:01,500"
+    assert format_timestamp(3661.5, ".") == "01:01:01.500"
+    assert format_timestamp(59.9996) == "00:01:00,000"
+    assert format_timestamp(36000.042) == "10:00:00,042"
+
+
+def test_to_srt():
+    assert to_srt(CUES) == ("1\n00:00:00,000 --> 00:00:02,500\n第一句\n\n"
+                            "2\n01:01:01,500 --> 01:01:03,250\nsecond\n")
+
+
+def test_to_vtt():
+    assert to_vtt(CUES) == ("WEBVTT\n\n00:00:00.000 --> 00:00:02.500\n第一句\n\n"
+                            "01:01:01.500 --> 01:01:03.250\nsecond\n")
+
+
+def test_to_text():
+    assert to_text(CUES) == "第一句\nsecond\n"
+
+
+def test_download_exports_requested_formats(start_mock, tmp_path):
+    mock = start_mock(videos=3)
+    subtitle_downloader = downloader(tmp_path, formats=("json", "srt"))
+    assert subtitle_downloader.download("BV", "p1_ai-zh", subtitle_url(mock))
+    directory = tmp_path / "subtitles" / "BV"
+    assert sorted(os.listdir(directory)) == ["p1_ai-zh.json", "p1_ai-zh.srt"]
+    cues = json.loads((directory / "p1_ai-zh.json").read_text(encoding="utf-8"))["body"]
+    assert (directory / "p1_ai-zh.srt").read_text(encoding="utf-8") == to_srt(cues)
+
+
+def test_transient_errors_are_retried(start_mock, tmp_path):
+    for status in (429, 503):
+        mock = start_mock(videos=3, error_status=status)
+        fail_first(mock, 2)
+        body = downloader(tmp_path, retries=3).fetch(subtitle_url(mock))
+        assert json.loads(body)["body"]
+        assert mock.stats()["requests"]["/aisubtitle"] == 3
+
+
+def test_retries_give_up(start_mock, tmp_path):
+    mock = start_mock(videos=3, error_rate=1.0, error_status=500)
+    assert not downloader(tmp_path, retries=2).download("BV", "1", subtitle_url(mock))
+    assert mock.stats()["requests"]["/aisubtitle"] == 3
+    assert not os.path.exists(tmp_path / "subtitles" / "BV")
+
+
+def test_forbidden_fails_without_retry(start_mock, tmp_path):
+    mock = start_mock(videos=3, error_rate=1.0, error_status=403)
+    assert not downloader(tmp_path, retries=3).download("BV", "1", subtitle_url(mock))
+    assert mock.stats()["requests"]["/aisubtitle"] == 1
+
+
+def test_cached_body_skips_the_request(start_mock, tmp_path):
+    mock = start_mock(videos=3)
+    cache = SubtitleCache(str(tmp_path / "cache.sqlite3"))
+    try:
+        url = subtitle_url(mock)
+        body = downloader(tmp_path, cache=cache).fetch(url + "?auth_key=1-0-0-a", "BV")
+        # The cache ignores the signature, which changes with every resolve
+        assert downloader(tmp_path, cache=cache).fetch(url + "?auth_key=2-0-0-b", "BV") == body
+        assert mock.stats()["requests"]["/aisubtitle"] == 1
+    finally:
+        cache.close()
+
+
+def test_jobs_name_files_by_part_and_language(tmp_path):
+    videos = [
+        {"url": "https://www.bilibili.com/video/BV1xx411c7mD/", "parts": [
+            {"cid": 1, "page": 1, "subtitles": [{"lan": "ai-zh", "url": "//a/1"}, {"lan": "ai-en", "url": "//a/2"}]},
+            {"cid": 2, "page": 2, "subtitles": [{"lan": "ai-zh", "url": "//a/3"}, {"lan": "zh", "url": ""}]},
+        ]},
+        {"alt": "旧 结果", "ai_subtitle_urls": ["https://a/4"]},
+    ]
+    assert list(downloader(tmp_path).jobs(videos)) == [
+        ("BV1xx411c7mD", "p1_ai-zh", "https://a/1"),
+        ("BV1xx411c7mD", "p1_ai-en", "https://a/2"),
+        ("BV1xx411c7mD", "p2_ai-zh", "https://a/3"),
+        ("旧_结果", "1", "https://a/4"),
+    ]
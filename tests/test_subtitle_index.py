@@ -0,0 +1,49 @@
+import pytest
+
+from subtitle_index import SubtitleIndex, bigrams
+
+CUES = ["你好世界", "我们的世界", "hi, Ab c", "，", "好"]
+
+
+@pytest.fixture
+def index(tmp_path):
+    subtitle_index = SubtitleIndex(str(tmp_path / "index.sqlite3"))
+    subtitle_index.log = lambda message: None
+    with subtitle_index.db:
+        subtitle_index.replace_file("a", "BV1xx411c7mD", "p2_ai-zh", 0, 0,
+                                    [{"from": i, "to": i + 1, "content": text} for i, text in enumerate(CUES)])
+    yield subtitle_index
+    subtitle_index.close()
+
+
+def texts(hits):
+    return sorted(hit["text"] for hit in hits)
+
+
+def test_bigrams():
+    assert bigrams("你好世界 hi, a") == "你好 好世 世界 界 hi i, , a"
+
+
+@pytest.mark.parametrize("query", ["你", "好", "世界", "界", "hi", "A", "Ab", "c", "，", "好 世", "的世 界"])
+def test_short_terms_match_like_a_scan(index, query):
+    expected = [text for text in CUES if all(term in text for term in query.split())]
+    assert texts(index.search(query)) == sorted(expected)
+
+
+def test_long_and_short_terms(index):
+    assert texts(index.search("你好世 界")) == ["你好世界"]
+    assert texts(index.search("我们的 你")) == []
+
+
+def test_replaced_cues_leave_the_short_index(index):
+    with index.db:
+        index.replace_file("a", "BV1xx411c7mD", "p2_ai-zh", 0, 0, [{"from": 0, "to": 1, "content": "新的"}])
+    assert index.search("世界") == []
+    assert texts(index.search("新")) == ["新的"]
+    assert index.db.execute("SELECT COUNT(*) FROM cues_short WHERE cues_short MATCH '世界'").fetchone()[0] == 0
+
+
+def test_hits_link_to_the_part(index):
+    hit = index.search("界")[0]
+    assert hit["page"] == 2
+    assert hit["url"].startswith("https://www.bilibili.com/video/BV1xx411c7mD/?p=2")
@@ -0,0 +1,121 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from subtitle_postprocess import SENTENCE_END, CueTable, exclusive_cumsum, ranges
+
+
+def corpus(seed):
+    """Random subtitles with repeated, empty and sentence-ending cues, overlaps and pauses"""
+    rng = random.Random(seed)
+    subtitles = []
+    for video in range(rng.randint(1, 4)):
+        cues, time = [], rng.uniform(0, 5)
+        for _ in range(rng.randint(0, 25)):
+            if cues and rng.random() < 0.25:
+                content = cues[-1]["content"]
+            else:
+                content = "".join(rng.choices("你好ab。?", k=rng.randint(0, 6)))
+            duration = rng.uniform(0.2, 4)
+            cues.append({"from": round(time, 3), "to": round(time + duration, 3), "content": content})
+            time += duration + rng.choice([-0.5, 0, 0.03, 0.5, 1, 3])
+        rng.shuffle(cues)
+        subtitles.append((f"BV{video}/p1_ai-zh", cues))
+    return subtitles
+
+
+def rows(subtitles):
+    """The cues as [name, start, end, text] rows in table order"""
+    return sorted(([name, cue["from"], cue["to"], cue["content"]] for name, cues in subtitles for cue in cues),
+                  key=lambda row: (int(row[0][2:].split("/")[0]), row[1]))
+
+
+def records(result):
+    return [{"video": name, "from": round(start, 3), "to": round(end, 3), "content": text}
+            for name, start, end, text in result]
+
+
+def dedupe(cues, tolerance=0.05):
+    result = []
+    for i, (name, start, end, text) in enumerate(cues):
+        previous = cues[i - 1] if i else None
+        if previous and name == previous[0] and text == previous[3] and start <= previous[2] + tolerance:
+            result[-1][2] = max(result[-1][2], end)
+        else:
+            result.append([name, start, end, text])
+    return result
+
+
+def merge(cues, separator, max_gap, max_chars, sentence_end=SENTENCE_END):
+    result, before = [], 0
+    for i, (name, start, end, text) in enumerate(cues):
+        previous = cues[i - 1] if i else None
+        if (not previous or name != previous[0] or start - previous[2] > max_gap
+                or previous[3][-1:] in tuple(sentence_end)):
+            before, head = 0, True
+        else:
+            head = max_chars and (before + len(previous[3])) // max_chars != before // max_chars
+            before += len(previous[3])
+        if head:
+            result.append([name, start, end, text])
+        else:
+            result[-1][2] = max(result[-1][2], end)
+            result[-1][3] += separator + text
+    return result
+
+
+def windows(cues, separator, window, stride):
+    result = []
+    for name in dict.fromkeys(cue[0] for cue in cues):
+        video = [cue for cue in cues if cue[0] == name]
+        video_end = max(cue[2] for cue in video)
+        for k in range(math.ceil(max(video_end - window, 0) / stride) + 1):
+            inside = [cue for cue in video if k * stride <= cue[1] < k * stride + window]
+            if inside:
+                result.append([name, k * stride, min(k * stride + window, video_end),
+                               separator.join(cue[3] for cue in inside)])
+    return result
+
+
+def gaps(cues, min_gap):
+    return [(a[0], a[2], b[1]) for a, b in zip(cues, cues[1:]) if a[0] == b[0] and b[1] - a[2] >= min_gap]
+
+
+def test_exclusive_cumsum_and_ranges():
+    assert exclusive_cumsum(np.array([3, 0, 2])).tolist() == [0, 3, 3]
+    assert ranges([10, 5, 0], [2, 0, 3]).tolist() == [10, 11, 0, 1, 2]
+    assert ranges([1], [0]).tolist() == []
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("separator", ["", " "])
+def test_matches_per_cue_reference(seed, separator):
+    subtitles = corpus(seed)
+    table = CueTable.from_cues(subtitles, separator=separator)
+    cues = rows(subtitles)
+    assert list(table.records()) == records(cues)
+
+    deduped = table.dedupe()
+    assert list(deduped.records()) == records(dedupe(cues))
+    cues = dedupe(cues)
+    assert list(deduped.merge(max_gap=0.8, max_chars=8).records()) == records(merge(cues, separator, 0.8, 8))
+    assert list(deduped.merge(max_gap=1.5, max_chars=0).records()) == records(merge(cues, separator, 1.5, 0))
+    assert list(deduped.windows(window=10, stride=4).records()) == records(windows(cues, separator, 10, 4))
+    names, starts, ends = deduped.gaps(min_gap=1)
+    assert list(zip(names, starts.tolist(), ends.tolist())) == gaps(cues, 1)
+
+
+def test_cues_without_text():
+    table = CueTable.from_cues([("a", [{"from": 0, "to": 1, "content": ""}, {"from": 1, "to": 2, "content": ""}])])
+    assert list(table.merge().records()) == [{"video": "a", "from": 0.0, "to": 2.0, "content": ""}]
+    assert list(table.dedupe().records()) == [{"video": "a", "from": 0.0, "to": 2.0, "content": ""}]
+    assert list(table.windows(window=1).records()) == [{"video": "a", "from": 0.0, "to": 1.0, "content": ""},
+                                                       {"video": "a", "from": 1.0, "to": 2.0, "content": ""}]
+
+
+def test_empty_table():
+    table = CueTable.from_cues([])
+    assert len(table.dedupe()) == len(table.merge()) == len(table.windows()) == 0
+    assert table.gaps()[0] == []
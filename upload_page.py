@@ -0,0 +1,28 @@
+# Cover image of every video card on the upload page
+CARD_IMG_SELECTOR = ("#app > main > div.space-upload > div.upload-content > div > div.video-body > div > div > div > div"
+                     " > div > div > div.bili-video-card__cover > a > div.bili-cover-card__thumbnail > img")
+
+# Collects every card of the page in one WebDriver round trip instead of
+# get_attribute("alt") + find_element(ancestor::a) + get_attribute("href") per card
+CARD_EXTRACT_SCRIPT = """
+return Array.from(document.querySelectorAll(arguments[0]), function (img) {
+    var link = img.closest('a');
+    var card = img.closest('.bili-video-card') || link || img;
+    var href = link ? link.href : '';
+    var bvid = (href.match(/BV[0-9A-Za-z]{10}/) || [''])[0];
+    var stats = card.querySelectorAll('.bili-cover-card__stat');
+    var subtitle = card.querySelector('.bili-video-card__subtitle');
+    return {
+        alt: img.getAttribute('alt') || '',
+        url: href,
+        bvid: bvid,
+        duration: stats.length ? stats[stats.length - 1].textContent.trim() : '',
+        published: subtitle ? subtitle.textContent.trim() : ''
+    };
+});
+"""
+
+
+def extract_cards(driver, selector=CARD_IMG_SELECTOR):
+    """Return alt, url, bvid, duration and published of every card on the page"""
+    return driver.execute_script(CARD_EXTRACT_SCRIPT, selector) or []